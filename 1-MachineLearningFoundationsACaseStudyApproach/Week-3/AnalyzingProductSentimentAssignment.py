@@ -3,6 +3,10 @@ Analyzing Product Sentiment
 """
 
 import graphlab
+from sentiment_utilities import add_selected_word_columns
+from sentiment_utilities import sentiment_model
+from sentiment_utilities import sentiment_split
+from sentiment_utilities import word_count_matrix
 
 def task_1(data, word_list):
     """Task 1
@@ -14,30 +18,14 @@ def task_1(data, word_list):
 
     # Build a word_count vector for each review with all words
     data["word_count"] = graphlab.text_analytics.count_words(data["review"])
+    # Tokenize once into a sparse count matrix over all words
+    matrix, word_index = word_count_matrix(data["word_count"])
     # Create column to count the selected words
+    add_selected_word_columns(data, matrix, word_index, word_list)
     for word in word_list:
-        data[word] = data["word_count"].apply(lambda x : selected_word_count(word, x))
         print "{0} Count: {1}".format(word, data[word].sum())
 
 
-def selected_word_count(word, word_list):
-    """Get Selected Word Count
-
-    Args:
-        word: The selected word
-        word_list: The word list
-
-    Returns:
-        An integer representing the occurrence of the word in the word list
-    """
-
-    # Check if the word is in the word list
-    if word in word_list:
-        return word_list[word]
-    else:
-        return 0
-
-
 def task_2(data, word_list):
     """Task 2
     """
@@ -46,17 +34,8 @@ def task_2(data, word_list):
     print "# Task 2 #"
     print "##########"
 
-    # Define positive and negative sentiment
-    sentiment_data = data[data["rating"] != 3] # Negative
-    sentiment_data["sentiment"] = sentiment_data["rating"] >=4 # Positive
-
-    # Train the classifier
-    train_data, test_data = sentiment_data.random_split(.8, seed=0)
-    # Build the model with the selected words
-    selected_words_model = graphlab.logistic_classifier.create(train_data,
-                                                               target="sentiment",
-                                                               features=word_list,
-                                                               validation_set=test_data)
+    # Build the model with the selected words (trained once, shared by the other tasks)
+    selected_words_model = sentiment_model(data, word_list, seed=0)
 
     # Sort the coefficients by value
     selected_words_model["coefficients"].sort("value", ascending=False)
@@ -72,17 +51,9 @@ def task_3(data, word_list):
     print "# Task 3 #"
     print "##########"
 
-    # Define positive and negative sentiment
-    sentiment_data = data[data["rating"] != 3] # Negative
-    sentiment_data["sentiment"] = sentiment_data["rating"] >=4 # Positive
-
-    # Train the classifier
-    train_data, test_data = sentiment_data.random_split(.8, seed=0)
-    # Build the model with the selected words
-    selected_words_model = graphlab.logistic_classifier.create(train_data,
-                                                               target="sentiment",
-                                                               features=word_list,
-                                                               validation_set=test_data)
+    # Get the train/test split and the model with the selected words
+    train_data, test_data = sentiment_split(data, seed=0)
+    selected_words_model = sentiment_model(data, word_list, seed=0)
 
     # Sort the coefficients by value
     selected_words_model["coefficients"].sort("value", ascending=False)
@@ -109,29 +80,17 @@ def task_4(data, word_list):
     product_review = data[data["name"] == product_name]
     #print "Product Review: {0}".format(len(product_review))
 
-    # Define positive and negative sentiment
-    sentiment_data = data[data["rating"] != 3] # Negative
-    sentiment_data["sentiment"] = sentiment_data["rating"] >=4 # Positive
-
-    # Train the classifier
-    train_data, test_data = sentiment_data.random_split(.8, seed=0)
-    # Build the model with the selected words
-    selected_words_model = graphlab.logistic_classifier.create(train_data,
-                                                               target="sentiment",
-                                                               features=word_list,
-                                                               validation_set=test_data)
-    # Build the model with all words
-    sentiment_model = graphlab.logistic_classifier.create(train_data,
-                                                        target="sentiment",
-                                                        features=["word_count"],
-                                                        validation_set=test_data)
+    # Get the model with the selected words
+    selected_words_model = sentiment_model(data, word_list, seed=0)
+    # Get the model with all words
+    all_words_model = sentiment_model(data, ["word_count"], seed=0)
 
     # Apply the learned model to understand sentiment with the selected words
     product_review["predicted_sentiment"] = selected_words_model.predict(product_review, output_type="probability")
     product_review = product_review.sort("predicted_sentiment", ascending=False)
     print "Most Positive Review (Selected Words):\n{0}".format(product_review[0:1])
     # Apply the learned model to understand sentiment with all words
-    product_review["predicted_sentiment"] = sentiment_model.predict(product_review, output_type="probability")
+    product_review["predicted_sentiment"] = all_words_model.predict(product_review, output_type="probability")
     product_review = product_review.sort("predicted_sentiment", ascending=False)
     print "Most Positive Review (All Words):\n{0}".format(product_review[0:1])
 
@@ -3,24 +3,8 @@ Analyzing Product Sentiment (Selected Words)
 """
 
 import graphlab
-
-def selected_word_count(word, word_list):
-    """Get Selected Word Count
-
-    Args:
-        word: The selected word
-        word_list: The word list
-
-    Returns:
-        An integer representing the occurrence of the word in the word list
-    """
-
-    # Check if the word is in the word list
-    if word in word_list:
-        return word_list[word]
-    else:
-        return 0
-
+from sentiment_utilities import add_selected_word_columns
+from sentiment_utilities import word_count_matrix
 
 def main():
     """Main Method
@@ -34,9 +18,11 @@ def main():
     # Build the word count vector for each review
     products["word_count"] = graphlab.text_analytics.count_words(products["review"])
 
+    # Tokenize once into a sparse count matrix over all words
+    matrix, word_index = word_count_matrix(products["word_count"])
     # Create column to count the selected words
+    add_selected_word_columns(products, matrix, word_index, selected_words)
     for word in selected_words:
-        products[word] = products["word_count"].apply(lambda x : selected_word_count(word, x))
         print "{0} Count: {1}".format(word, products[word].sum())
 
     # Define positive and negative sentiment
@@ -0,0 +1,150 @@
+"""
+Sentiment Analysis Utilities
+"""
+
+import graphlab
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Split and trained models, shared by every task of a run. Entries are keyed by the
+# data they come from (see _data_key) and keep a reference to it.
+_split_cache = {}
+_model_cache = {}
+
+
+def _data_key(data):
+    """Identify a dataset: its id is not reused while a cache entry holds a reference
+    to it, and its length changes when rows are added in place
+    """
+
+    return id(data), len(data)
+
+
+def word_count_matrix(word_counts, vocabulary=None):
+    """Build A Sparse Word Count Matrix
+
+    Args:
+        word_counts: The word count dictionary of each review (the "word_count" column)
+        vocabulary: The words to count, or None to count every word seen
+
+    Returns:
+        A tuple of the CSR count matrix (one row per review, one column per word) and
+        a dictionary mapping each word to its column
+    """
+
+    if vocabulary is None:
+        word_index = {}
+    else:
+        word_index = dict((word, j) for j, word in enumerate(vocabulary))
+
+    indices = []
+    counts = []
+    indptr = [0]
+    # Single pass over the reviews
+    for word_count in word_counts:
+        for word, count in word_count.items():
+            j = word_index.get(word)
+            if j is None:
+                if vocabulary is not None:
+                    continue
+                j = word_index[word] = len(word_index)
+            indices.append(j)
+            counts.append(count)
+        indptr.append(len(indices))
+
+    matrix = csr_matrix((np.array(counts, dtype=np.int64), np.array(indices, dtype=np.int64), np.array(indptr)),
+                        shape=(len(indptr) - 1, len(word_index)))
+    return matrix, word_index
+
+
+def selected_word_columns(matrix, word_index, word_list):
+    """Get Selected Word Columns
+
+    Args:
+        matrix: The word count matrix
+        word_index: The word to column dictionary
+        word_list: The selected words
+
+    Returns:
+        A dense array with one column of counts per selected word (zeros for unseen words)
+    """
+
+    columns = np.zeros((matrix.shape[0], len(word_list)), dtype=np.int64)
+    found = [(i, word_index[word]) for i, word in enumerate(word_list) if word in word_index]
+    if found:
+        # Column slice of the CSR matrix, without converting the whole matrix
+        columns[:, [i for i, j in found]] = csr_matrix(matrix)[:, [j for i, j in found]].toarray()
+    return columns
+
+
+def add_selected_word_columns(data, matrix, word_index, word_list):
+    """Add Selected Word Columns
+
+    Add one count column per selected word to the data, sliced from the word count
+    matrix of its reviews instead of a pass over the reviews per word.
+
+    Args:
+        data: The review data
+        matrix: The word count matrix of the data (see word_count_matrix)
+        word_index: The word to column dictionary
+        word_list: The selected words
+    """
+
+    columns = selected_word_columns(matrix, word_index, word_list)
+    for i, word in enumerate(word_list):
+        data[word] = graphlab.SArray(columns[:, i].tolist())
+
+
+def sentiment_split(data, seed=0):
+    """Get The Sentiment Train/Test Split
+
+    Computed once per (data, seed): 3* reviews are dropped, 4* and 5* reviews are positive.
+
+    Args:
+        data: The review data
+        seed: The random split seed
+
+    Returns:
+        A tuple of the train and test data
+    """
+
+    key = (_data_key(data), seed)
+    if key not in _split_cache or _split_cache[key][0] is not data:
+        # Define positive and negative sentiment
+        sentiment_data = data[data["rating"] != 3] # Negative
+        sentiment_data["sentiment"] = sentiment_data["rating"] >= 4 # Positive
+        _split_cache[key] = (data, sentiment_data.random_split(.8, seed=seed))
+    return _split_cache[key][1]
+
+
+def sentiment_model(data, features, seed=0):
+    """Get A Sentiment Model
+
+    Trained once per (data, features, seed); later calls return the same model.
+
+    Args:
+        data: The review data
+        features: The feature columns
+        seed: The random split seed
+
+    Returns:
+        The logistic classifier
+    """
+
+    key = (_data_key(data), tuple(features), seed)
+    if key not in _model_cache or _model_cache[key][0] is not data:
+        train_data, test_data = sentiment_split(data, seed)
+        model = graphlab.logistic_classifier.create(train_data,
+                                                    target="sentiment",
+                                                    features=features,
+                                                    validation_set=test_data)
+        _model_cache[key] = (data, model)
+    return _model_cache[key][1]
+
+
+def clear_cache():
+    """Clear The Split And Model Caches
+    """
+
+    _split_cache.clear()
+    _model_cache.clear()
@@ -0,0 +1,302 @@
+"""
+Document Retrieval Utilities
+"""
+
+import json
+import os
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+def count_words(text):
+    """Count Words
+
+    Args:
+        text: The document text
+
+    Returns:
+        A dictionary of lower-cased, whitespace-separated words to their counts
+    """
+
+    return dict(Counter(text.lower().split()))
+
+
+def _count_matrix(texts, vocabulary):
+    """Tokenize documents into a CSR count matrix, adding unseen words to the vocabulary
+    """
+
+    indices = []
+    counts = []
+    indptr = [0]
+    for text in texts:
+        for word, count in count_words(text).items():
+            if word not in vocabulary:
+                vocabulary[word] = len(vocabulary)
+            indices.append(vocabulary[word])
+            counts.append(count)
+        indptr.append(len(indices))
+
+    return csr_matrix((np.array(counts, dtype=np.float64), np.array(indices, dtype=np.int64),
+                       np.array(indptr, dtype=np.int64)), shape=(len(texts), len(vocabulary)))
+
+
+def inverse_document_frequency(index):
+    """Get The Inverse Document Frequency
+
+    Args:
+        index: The document index
+
+    Returns:
+        An array of log(number of documents / document frequency) per word, as in tf_idf
+    """
+
+    document_frequency = np.maximum(index["document_frequency"], 1)
+    return np.log(float(index["num_documents"]) / document_frequency)
+
+
+def _word_weights(index, weighting):
+    """Per-word weights of a weighting: 'tfidf' or 'word_count'
+    """
+
+    if weighting == "tfidf":
+        return inverse_document_frequency(index)
+    elif weighting == "word_count":
+        return np.ones(len(index["vocabulary"]))
+    raise ValueError("Unknown weighting: {0}".format(weighting))
+
+
+def _update_norms(index):
+    """Recompute the document norms of both weightings with one product each
+    """
+
+    squared_counts = index["counts"].multiply(index["counts"])
+    idf = inverse_document_frequency(index)
+    index["norms"] = {"word_count": np.sqrt(np.asarray(squared_counts.sum(axis=1)).ravel()),
+                      "tfidf": np.sqrt(squared_counts.dot(idf ** 2))}
+
+
+def build_index(names, texts):
+    """Build A Document Index
+
+    The index keeps the raw word counts, the document frequencies and the norms of
+    every document; TF-IDF weights are applied to the query side when searching, so
+    adding documents only needs the new document frequencies and norms.
+
+    Args:
+        names: The document names
+        texts: The document texts
+
+    Returns:
+        The document index
+    """
+
+    vocabulary = {}
+    counts = _count_matrix(texts, vocabulary)
+    index = {"names": list(names),
+             "vocabulary": vocabulary,
+             "counts": counts,
+             "document_frequency": np.bincount(counts.indices, minlength=len(vocabulary)),
+             "num_documents": counts.shape[0]}
+    index["rows"] = dict((name, i) for i, name in enumerate(index["names"]))
+    _update_norms(index)
+    return index
+
+
+def add_documents(index, names, texts):
+    """Add Documents To An Index
+
+    Args:
+        index: The document index
+        names: The new document names
+        texts: The new document texts
+
+    Returns:
+        The updated document index
+    """
+
+    vocabulary = dict(index["vocabulary"])
+    new_counts = _count_matrix(texts, vocabulary)
+    num_words = len(vocabulary)
+
+    counts = index["counts"]
+    index["counts"] = csr_matrix((np.concatenate((counts.data, new_counts.data)),
+                                  np.concatenate((counts.indices, new_counts.indices)),
+                                  np.concatenate((counts.indptr, new_counts.indptr[1:] + counts.nnz))),
+                                 shape=(counts.shape[0] + new_counts.shape[0], num_words))
+    document_frequency = np.zeros(num_words, dtype=np.int64)
+    document_frequency[:len(index["document_frequency"])] = index["document_frequency"]
+    index["document_frequency"] = document_frequency + np.bincount(new_counts.indices, minlength=num_words)
+
+    index["vocabulary"] = vocabulary
+    index["num_documents"] += new_counts.shape[0]
+    for name in names:
+        index["rows"][name] = len(index["names"])
+        index["names"].append(name)
+    _update_norms(index)
+    return index
+
+
+def save_index(dirname, index):
+    """Save A Document Index
+
+    Args:
+        dirname: The index directory
+        index: The document index
+    """
+
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    counts = index["counts"]
+    for name, array in [("counts_data", counts.data), ("counts_indices", counts.indices),
+                        ("counts_indptr", counts.indptr), ("document_frequency", index["document_frequency"]),
+                        ("norms_word_count", index["norms"]["word_count"]), ("norms_tfidf", index["norms"]["tfidf"])]:
+        np.save(os.path.join(dirname, name + ".npy"), array)
+    words = sorted(index["vocabulary"], key=index["vocabulary"].get)
+    with open(os.path.join(dirname, "index.json"), "w") as f:
+        json.dump({"names": index["names"], "vocabulary": words, "num_documents": index["num_documents"]}, f)
+
+
+def load_index(dirname, mmap_mode="r"):
+    """Load A Document Index
+
+    Args:
+        dirname: The index directory
+        mmap_mode: The numpy memory-map mode of the arrays (None to read them into memory)
+
+    Returns:
+        The document index
+    """
+
+    load = lambda name: np.load(os.path.join(dirname, name + ".npy"), mmap_mode=mmap_mode)
+    with open(os.path.join(dirname, "index.json")) as f:
+        index = json.load(f)
+
+    index["vocabulary"] = dict((word, j) for j, word in enumerate(index["vocabulary"]))
+    index["rows"] = dict((name, i) for i, name in enumerate(index["names"]))
+    index["counts"] = csr_matrix((load("counts_data"), load("counts_indices"), load("counts_indptr")),
+                                 shape=(len(index["names"]), len(index["vocabulary"])), copy=False)
+    index["document_frequency"] = load("document_frequency")
+    index["norms"] = {"word_count": load("norms_word_count"), "tfidf": load("norms_tfidf")}
+    return index
+
+
+def document_vectors(index, names, weighting="tfidf"):
+    """Get L2-Normalized Document Vectors
+
+    Args:
+        index: The document index
+        names: The document names
+        weighting: 'tfidf' or 'word_count'
+
+    Returns:
+        A CSR matrix with one normalized row per document
+    """
+
+    rows = [index["rows"][name] for name in names]
+    norms = index["norms"][weighting][rows]
+    vectors = index["counts"][rows].multiply(_word_weights(index, weighting)).tocsr()
+    return csr_matrix(vectors.multiply(1. / np.where(norms > 0, norms, 1.)[:, np.newaxis]))
+
+
+def text_vectors(index, texts, weighting="tfidf"):
+    """Get L2-Normalized Vectors Of Raw Texts, Over The Index Vocabulary
+
+    Args:
+        index: The document index
+        texts: The query texts
+        weighting: 'tfidf' or 'word_count'
+
+    Returns:
+        A CSR matrix with one normalized row per text
+    """
+
+    vocabulary = dict(index["vocabulary"])
+    counts = _count_matrix(texts, vocabulary)
+    # Words outside the index vocabulary match no document
+    counts = counts[:, :len(index["vocabulary"])].multiply(_word_weights(index, weighting)).tocsr()
+    norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel())
+    return csr_matrix(counts.multiply(1. / np.where(norms > 0, norms, 1.)[:, np.newaxis]))
+
+
+def cosine_distance(index, name_1, name_2, weighting="tfidf"):
+    """Get The Cosine Distance Between Two Documents
+
+    Args:
+        index: The document index
+        name_1: The first document name
+        name_2: The second document name
+        weighting: 'tfidf' or 'word_count'
+
+    Returns:
+        The cosine distance
+    """
+
+    vectors = document_vectors(index, [name_1, name_2], weighting)
+    return 1 - vectors[0].multiply(vectors[1]).sum()
+
+
+def top_words(index, name, num_words=3, weighting="tfidf"):
+    """Get The Highest Weighted Words Of A Document
+
+    Args:
+        index: The document index
+        name: The document name
+        num_words: The number of words
+        weighting: 'tfidf' or 'word_count'
+
+    Returns:
+        A list of (word, weight) pairs sorted by decreasing weight
+    """
+
+    row = index["counts"][index["rows"][name]]
+    weights = row.data * _word_weights(index, weighting)[row.indices]
+    words = sorted(index["vocabulary"], key=index["vocabulary"].get)
+    order = np.argsort(-weights, kind="mergesort")[:num_words]
+    return [(words[row.indices[j]], weights[j]) for j in order]
+
+
+def _top_k(index, query_vectors, k, weighting):
+    """Top k documents of every normalized query row; returns (ids, distances)
+    """
+
+    k = min(k, index["counts"].shape[0])
+    # Documents are scored on their raw counts, so the (already weighted) queries are
+    # weighted once more, and the scores divided by the document norms
+    weights = _word_weights(index, weighting)
+    scores = index["counts"].dot(query_vectors.multiply(weights).T.tocsc()).T.toarray()
+    norms = index["norms"][weighting]
+    scores /= np.where(norms > 0, norms, 1.)
+
+    ids = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top = np.take_along_axis(scores, ids, axis=1)
+    order = np.argsort(-top, axis=1, kind="mergesort")
+    return np.take_along_axis(ids, order, axis=1), 1 - np.take_along_axis(top, order, axis=1)
+
+
+def query(index, names=None, texts=None, k=5, weighting="tfidf"):
+    """Find The Nearest Documents By Cosine Distance
+
+    Queries are scored in one batch, either documents of the index by name or raw
+    texts. The query document itself is part of its results, at distance 0.
+
+    Args:
+        index: The document index
+        names: The query document names
+        texts: The query texts
+        k: The number of neighbors
+        weighting: 'tfidf' or 'word_count'
+
+    Returns:
+        A list with one list of (name, distance) pairs per query
+    """
+
+    if names is not None:
+        vectors = document_vectors(index, names, weighting)
+    else:
+        vectors = text_vectors(index, texts, weighting)
+
+    ids, distances = _top_k(index, vectors, k, weighting)
+    return [[(index["names"][i], d) for i, d in zip(query_ids, query_distances)]
+            for query_ids, query_distances in zip(ids, distances)]
@@ -0,0 +1,271 @@
+"""
+Song Recommender Utilities
+"""
+
+import multiprocessing
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+def listen_matrix(user_ids, items, listen_counts=None):
+    """Build The User-Item Listen Matrix
+
+    Args:
+        user_ids: The user id of each listen record
+        items: The item (song) of each listen record
+        listen_counts: The listen count of each record, or None to count records
+
+    Returns:
+        A tuple of the CSR users-by-items listen count matrix, the sorted unique users
+        and the sorted unique items
+    """
+
+    users, user_rows = np.unique(np.asarray(user_ids), return_inverse=True)
+    unique_items, item_columns = np.unique(np.asarray(items), return_inverse=True)
+    if listen_counts is None:
+        listen_counts = np.ones(len(user_rows))
+    # Duplicate (user, item) records are summed
+    matrix = csr_matrix((np.asarray(listen_counts, dtype=np.float64), (user_rows, item_columns)),
+                        shape=(len(users), len(unique_items)))
+    matrix.sum_duplicates()
+    return matrix, users, unique_items
+
+
+def _row_top_n(block, top_n):
+    """Column ids and values of the top_n largest entries of each row of a dense block
+    """
+
+    top_n = min(top_n, block.shape[1])
+    ids = np.argpartition(-block, top_n - 1, axis=1)[:, :top_n]
+    top = np.take_along_axis(block, ids, axis=1)
+    order = np.argsort(-top, axis=1, kind="mergesort")
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+# Matrices handed to each worker process. With the fork start method the workers
+# inherit them from the parent without any pickling.
+_recommender_worker_data = None
+
+
+def _recommender_worker_init(data):
+    global _recommender_worker_data
+    _recommender_worker_data = data
+
+
+def _recommender_worker_map(function, tasks, data, n_jobs):
+    """Run function over tasks, in a pool of n_jobs processes sharing data
+    """
+
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    if n_jobs <= 1 or len(tasks) <= 1:
+        _recommender_worker_init(data)
+        try:
+            return [function(task) for task in tasks]
+        finally:
+            _recommender_worker_init(None)
+
+    try:
+        context = multiprocessing.get_context("fork")
+    except (AttributeError, ValueError):
+        context = multiprocessing
+    pool = context.Pool(min(n_jobs, len(tasks)), initializer=_recommender_worker_init, initargs=(data,))
+    try:
+        return pool.map(function, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _similarity_block(args):
+    """Top-N neighbors of the items start:end
+    """
+
+    start, end, similarity, top_n = args
+    items_by_users, users_by_items, item_sizes = _recommender_worker_data
+    # Co-occurrence (jaccard) or dot products (cosine) of the block with every item
+    block = items_by_users[start:end].dot(users_by_items).toarray()
+    if similarity == "jaccard":
+        union = item_sizes[start:end, np.newaxis] + item_sizes - block
+        block /= np.where(union > 0, union, 1.)
+    else:
+        norms = item_sizes[start:end, np.newaxis] * item_sizes
+        block /= np.where(norms > 0, norms, 1.)
+    # An item is not its own neighbor
+    block[np.arange(end - start), np.arange(start, end)] = -np.inf
+    neighbors, scores = _row_top_n(block, top_n)
+    return neighbors.astype(np.int32), scores.astype(np.float32)
+
+
+def item_similarity_table(matrix, similarity="jaccard", top_n=64, block_size=1024, n_jobs=1):
+    """Compute The Top-N Item-Item Similarity Table
+
+    Similarities are computed for block_size items at a time with one sparse product,
+    and only the top_n most similar items of each item are kept, so the full
+    item-by-item matrix is never held.
+
+    Args:
+        matrix: The users-by-items listen matrix
+        similarity: 'jaccard' (on who listened) or 'cosine' (on listen counts)
+        top_n: The number of neighbors kept per item
+        block_size: The number of items per block
+        n_jobs: The number of processes (-1 for all cores)
+
+    Returns:
+        A tuple of the items-by-top_n neighbor ids and similarity scores
+    """
+
+    if similarity == "jaccard":
+        matrix = csr_matrix((np.ones(matrix.nnz), matrix.indices, matrix.indptr), shape=matrix.shape)
+        item_sizes = np.asarray(matrix.sum(axis=0)).ravel()
+    elif similarity == "cosine":
+        item_sizes = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    else:
+        raise ValueError("Unknown similarity: {0}".format(similarity))
+
+    num_items = matrix.shape[1]
+    items_by_users = matrix.T.tocsr()
+    tasks = [(start, min(start + block_size, num_items), similarity, top_n)
+             for start in range(0, num_items, block_size)]
+    results = _recommender_worker_map(_similarity_block, tasks, (items_by_users, matrix.tocsr(), item_sizes), n_jobs)
+
+    neighbors = np.vstack([neighbors for neighbors, scores in results])
+    scores = np.vstack([scores for neighbors, scores in results])
+    # Items with fewer than top_n others have -inf padding; drop it from the scores
+    return neighbors, np.where(np.isfinite(scores), scores, 0).astype(np.float32)
+
+
+def item_similarity_recommender(user_ids, items, listen_counts=None, similarity="jaccard", top_n=64, n_jobs=1):
+    """Create An Item Similarity Recommender
+
+    Args:
+        user_ids: The user id of each listen record
+        items: The item (song) of each listen record
+        listen_counts: The listen count of each record, or None
+        similarity: 'jaccard' or 'cosine'
+        top_n: The number of neighbors kept per item
+        n_jobs: The number of processes (-1 for all cores)
+
+    Returns:
+        The recommender model
+    """
+
+    matrix, users, unique_items = listen_matrix(user_ids, items, listen_counts)
+    neighbors, scores = item_similarity_table(matrix, similarity, top_n, n_jobs=n_jobs)
+
+    # Compact items-by-items matrix holding only the kept neighbors
+    num_items = len(unique_items)
+    top_n = neighbors.shape[1]
+    similarities = csr_matrix((scores.ravel(), neighbors.ravel(), np.arange(0, num_items * top_n + 1, top_n)),
+                              shape=(num_items, num_items))
+    similarities.eliminate_zeros()
+
+    return {"matrix": matrix,
+            "users": users,
+            "items": unique_items,
+            "user_index": dict((user, i) for i, user in enumerate(users)),
+            "neighbors": neighbors,
+            "scores": scores,
+            "similarities": similarities,
+            # Items ranked by number of listeners, for users without history
+            "popularity": np.argsort(-np.diff(matrix.tocsc().indptr), kind="mergesort")}
+
+
+def _recommend_block(args):
+    """Top k items of a block of known users
+    """
+
+    rows, k, exclude_known = args
+    matrix, similarities = _recommender_worker_data
+    history = matrix[rows]
+    history = csr_matrix((np.ones(history.nnz), history.indices, history.indptr), shape=history.shape)
+    # Average similarity of each item to the items of the user's history
+    block = history.dot(similarities).toarray()
+    block /= np.maximum(np.diff(history.indptr), 1)[:, np.newaxis]
+    if exclude_known:
+        block[np.repeat(np.arange(len(rows)), np.diff(history.indptr)), history.indices] = -np.inf
+    return _row_top_n(block, k)
+
+
+def _fill_by_popularity(ids, scores, excluded, popularity, k):
+    """Keep the items with a positive score, then add the most popular items that are
+    neither excluded nor already kept, up to k
+    """
+
+    keep = scores > 0
+    ids, scores = list(ids[keep]), list(scores[keep])
+    skip = set(excluded) | set(ids)
+    for item in popularity:
+        if len(ids) == k:
+            break
+        if item not in skip:
+            ids.append(item)
+            scores.append(0.)
+    return np.array(ids, dtype=np.int64), np.array(scores)
+
+
+def recommend(model, users, k=10, exclude_known=True, block_size=1024, n_jobs=1):
+    """Recommend Items To A Batch Of Users
+
+    The score of an item for a user is its average similarity to the items the user
+    listened to, using only the kept top-N neighbors. Items without any similarity to
+    the user's history are not ranked by score: the remaining places go to the most
+    popular items, with score 0, as do all the places of users without history. A
+    user with fewer than k items left to recommend gets fewer recommendations.
+
+    Args:
+        model: The recommender model
+        users: The user ids
+        k: The number of recommendations per user
+        exclude_known: If True, items the user already listened to are not recommended
+        block_size: The number of users per block
+        n_jobs: The number of processes (-1 for all cores)
+
+    Returns:
+        A tuple of two lists with one array per user: the recommended items and their
+        scores, by decreasing score
+    """
+
+    k = min(k, len(model["items"]))
+    rows = np.array([model["user_index"].get(user, -1) for user in users], dtype=np.int64)
+    known = np.flatnonzero(rows >= 0)
+
+    item_ids = np.zeros((len(rows), k), dtype=np.int64)
+    scores = np.zeros((len(rows), k))
+    tasks = [(rows[known[start:start + block_size]], k, exclude_known) for start in range(0, len(known), block_size)]
+    results = _recommender_worker_map(_recommend_block, tasks, (model["matrix"], model["similarities"]), n_jobs)
+    if results:
+        item_ids[known] = np.vstack([ids for ids, block_scores in results])
+        scores[known] = np.vstack([block_scores for ids, block_scores in results])
+
+    matrix = model["matrix"]
+    recommended_items = []
+    recommended_scores = []
+    for i, row in enumerate(rows):
+        ids, row_scores = item_ids[i], scores[i]
+        # Most users have k items with a positive score; only the others are filled in
+        if row < 0 or np.any(row_scores <= 0):
+            history = matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]] if row >= 0 and exclude_known else []
+            ids, row_scores = _fill_by_popularity(ids, row_scores, history, model["popularity"], k)
+        recommended_items.append(model["items"][ids])
+        recommended_scores.append(row_scores)
+
+    return recommended_items, recommended_scores
+
+
+def most_recommended(recommended_items):
+    """Count How Often Each Item Is Recommended
+
+    Args:
+        recommended_items: The recommended items of every user (as returned by recommend)
+
+    Returns:
+        A tuple of the items and their counts, by decreasing count
+    """
+
+    if len(recommended_items) == 0:
+        return np.array([]), np.array([], dtype=np.int64)
+    items, counts = np.unique(np.concatenate([np.ravel(items) for items in recommended_items]), return_counts=True)
+    order = np.argsort(-counts, kind="mergesort")
+    return items[order], counts[order]
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+import hashlib
+import numpy as np
+
+# Maximum number of features whose expansion is kept
+POLYNOMIAL_CACHE_SIZE = 8
+
+# Expansions computed so far, keyed by (hash of the feature values, length, scale), least
+# recently used first. Each entry holds the matrix of the largest degree requested, and
+# lower degrees are prefixes of it.
+_polynomial_cache = OrderedDict()
+
+def clear_polynomial_cache():
+    '''Drop every cached expansion, e.g. once a degree sweep is done.'''
+    _polynomial_cache.clear()
+
+def polynomial_matrix(feature, max_degree, scale=False, cache=True):
+    '''
+    Expand a feature into the float64 matrix [x, x^2, ..., x^max_degree] in one pass,
+    each power being the previous one times x.
+    scale: if True, x is divided by max|x| first, so every column lies in [-1, 1]; the
+           columns of the unscaled expansion are matrix * scales.
+    cache: if True, expansions are kept by feature values and scale, so a degree 1..15
+           sweep expands the feature once and gets read-only prefixes of that matrix.
+           Only the POLYNOMIAL_CACHE_SIZE most recently used features are kept;
+           clear_polynomial_cache() frees them all.
+    Returns (matrix, scales), like normalize_features returns (features, norms).
+
+    Example
+    >>> matrix, scales = polynomial_matrix(sales['sqft_living'], 15, scale=True)
+    >>> poly3, scales3 = polynomial_matrix(sales['sqft_living'], 3, scale=True) # cache hit
+    '''
+    x = np.asarray(feature, dtype=np.float64)
+    key = None
+    if cache:
+        key = (hashlib.sha1(np.ascontiguousarray(x).view(np.uint8)).hexdigest(), len(x), bool(scale))
+        if key in _polynomial_cache and _polynomial_cache[key][0].shape[1] >= max_degree:
+            # Move the entry to the most recently used end
+            matrix, scales = _polynomial_cache[key] = _polynomial_cache.pop(key)
+            return matrix[:, :max_degree], scales[:max_degree]
+
+    base = 1.
+    if scale:
+        base = np.max(np.abs(x)) if len(x) else 1.
+        base = base if base > 0 else 1.
+    matrix = np.empty((len(x), max_degree))
+    if max_degree > 0:
+        matrix[:, 0] = x / base
+        for power in range(1, max_degree):
+            np.multiply(matrix[:, power-1], matrix[:, 0], out=matrix[:, power])
+    scales = base ** np.arange(1, max_degree + 1, dtype=np.float64)
+
+    if cache:
+        matrix.setflags(write=False)
+        scales.setflags(write=False)
+        _polynomial_cache.pop(key, None)
+        _polynomial_cache[key] = (matrix, scales)
+        while len(_polynomial_cache) > POLYNOMIAL_CACHE_SIZE:
+            _polynomial_cache.popitem(last=False)
+    return matrix, scales
+
+def _new_frame(like):
+    # An empty frame of the same library as like: pandas for pandas objects, SFrame otherwise
+    if hasattr(like, 'iloc'):
+        import pandas
+        return pandas.DataFrame(index=like.index)
+    import graphlab
+    return graphlab.SFrame()
+
+def polynomial_sframe(feature, degree, scale=False):
+    '''
+    Same columns as the notebook's polynomial_sframe (power_1 ... power_degree), built
+    from polynomial_matrix instead of one apply() per power.'''
+    matrix = polynomial_matrix(feature, degree, scale)[0]
+    poly_sframe = _new_frame(feature)
+    for power in range(1, degree + 1):
+        poly_sframe['power_' + str(power)] = matrix[:, power-1]
+    return poly_sframe
+
+def polynomial_features(data, deg):
+    '''
+    Same as the overfitting demo's polynomial_features: a copy of data with the columns
+    X2 ... Xdeg, the powers of X1, built from polynomial_matrix.'''
+    matrix = polynomial_matrix(data['X1'], deg)[0]
+    data_copy = data.copy()
+    for i in range(1, deg):
+        data_copy['X'+str(i+1)] = matrix[:, i]
+    return data_copy
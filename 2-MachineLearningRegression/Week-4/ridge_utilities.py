@@ -0,0 +1,129 @@
+import numpy as np
+
+def get_numpy_data(data_sframe, features, output):
+    data_sframe['constant'] = 1 # add a constant column to the SFrame
+    # prepend 'constant' to the features so it is extracted with the others
+    features = ['constant'] + features
+    feature_matrix = data_sframe[features].to_numpy()
+    output_array = data_sframe[output].to_numpy()
+    return(feature_matrix, output_array)
+
+def predict_output(feature_matrix, weights):
+    return np.dot(feature_matrix, weights)
+
+# All solvers below minimize the cost of the notebook's ridge_regression_gradient_descent,
+#     RSS(w) + l2_penalty * (w[1]^2 + ... + w[d-1]^2),
+# where column 0 of feature_matrix is the constant column of get_numpy_data and its
+# weight (the intercept) is not penalized. The intercept is eliminated by centering the
+# other columns, which leaves a problem where every weight is penalized alike:
+#     (C + l2_penalty I) w = c,    C = Xc^T Xc,  c = Xc^T yc
+# With C = V diag(s) V^T, w = V diag(1 / (s + l2_penalty)) V^T c for any penalty, so one
+# decomposition serves a whole list of penalties.
+
+def _ridge_solve_all(s, V, c, l2_penalties):
+    # d-by-len(l2_penalties) weights of the centered problem, one column per penalty
+    return V.dot(V.T.dot(c)[:, np.newaxis] / (s[:, np.newaxis] + l2_penalties))
+
+def ridge_path(feature_matrix, output, l2_penalties):
+    '''
+    Ridge weights for every penalty in l2_penalties, as a len(l2_penalties)-by-d array.
+    Uses one SVD of the centered features, which is more accurate than forming X^T X.
+
+    Example
+    >>> weights = ridge_path(simple_feature_matrix, output, [0., 1e11])
+    '''
+    l2_penalties = np.atleast_1d(np.asarray(l2_penalties, dtype=float))
+    features = feature_matrix[:, 1:]
+    feature_mean = features.mean(axis=0)
+    output_mean = output.mean()
+    U, singular_values, Vt = np.linalg.svd(features - feature_mean, full_matrices=False)
+
+    # w = V diag(sigma / (sigma^2 + l2_penalty)) U^T yc
+    projection = U.T.dot(output - output_mean)
+    shrink = singular_values[:, np.newaxis] / (singular_values[:, np.newaxis] ** 2 + l2_penalties)
+    weights = Vt.T.dot(projection[:, np.newaxis] * shrink)
+
+    return np.column_stack((output_mean - feature_mean.dot(weights), weights.T))
+
+def ridge_regression(feature_matrix, output, l2_penalty):
+    '''
+    Closed-form replacement for ridge_regression_gradient_descent: the weights that the
+    gradient descent converges to, without iterating.
+
+    Example
+    >>> simple_weights_high_penalty = ridge_regression(simple_feature_matrix, output, 1e11)
+    '''
+    return ridge_path(feature_matrix, output, [l2_penalty])[0]
+
+def ridge_loo_error(feature_matrix, output, l2_penalties):
+    '''
+    Exact leave-one-out RSS of ridge regression for every penalty in l2_penalties,
+    without refitting. Ridge predictions are H y for a hat matrix H, and the residual
+    of row i when it is left out of the fit is (y_i - prediction_i) / (1 - H_ii).
+    The diagonal of H for all penalties comes from the same SVD as ridge_path.'''
+    l2_penalties = np.atleast_1d(np.asarray(l2_penalties, dtype=float))
+    n = feature_matrix.shape[0]
+    features = feature_matrix[:, 1:] - feature_matrix[:, 1:].mean(axis=0)
+    centered_output = output - output.mean()
+    U, singular_values, Vt = np.linalg.svd(features, full_matrices=False)
+
+    # H = 11^T / n + U diag(sigma^2 / (sigma^2 + l2_penalty)) U^T, one column per penalty
+    sigma_squared = singular_values[:, np.newaxis] ** 2
+    shrink = sigma_squared / (sigma_squared + l2_penalties)
+    hat_diagonal = 1. / n + (U ** 2).dot(shrink)
+    fitted = U.dot(U.T.dot(centered_output)[:, np.newaxis] * shrink)
+
+    loo_residuals = (centered_output[:, np.newaxis] - fitted) / (1 - hat_diagonal)
+    return np.sum(loo_residuals ** 2, axis=0)
+
+def ridge_k_fold_cross_validation(k, l2_penalties, feature_matrix, output):
+    '''
+    Average validation RSS of k-fold cross validation for every penalty in l2_penalties,
+    with the same contiguous folds as the notebook's k_fold_cross_validation (so shuffle
+    the rows first). X^T X and X^T y are computed once for all rows; each fold subtracts
+    the statistics of its validation rows, and all penalties are solved with one
+    eigendecomposition per fold.
+
+    Features of very different scales (such as high powers of sqft_living) make X^T X
+    ill-conditioned; scale the columns first.
+
+    Example
+    >>> l2_penalty_value = np.logspace(1, 7, num=13)
+    >>> cv_error = ridge_k_fold_cross_validation(10, l2_penalty_value, feature_matrix_15, output)
+    >>> lowest_l2 = l2_penalty_value[np.argmin(cv_error)]
+    '''
+    l2_penalties = np.atleast_1d(np.asarray(l2_penalties, dtype=float))
+    n = feature_matrix.shape[0]
+    features = feature_matrix[:, 1:]
+
+    # Statistics of all rows, shifted by the overall mean to limit cancellation
+    shift = features.mean(axis=0)
+    output_shift = output.mean()
+    features = features - shift
+    shifted_output = output - output_shift
+    gram = features.T.dot(features)
+    xty = features.T.dot(shifted_output)
+    feature_sum = features.sum(axis=0)
+    output_sum = shifted_output.sum()
+
+    error = np.zeros(len(l2_penalties))
+    for i in range(k):
+        start = (n * i) // k
+        end = (n * (i + 1)) // k
+        validation_features = features[start:end]
+        validation_output = shifted_output[start:end]
+
+        # Downdate the statistics to the training rows, then center them
+        num_train = n - (end - start)
+        feature_mean = (feature_sum - validation_features.sum(axis=0)) / num_train
+        output_mean = (output_sum - validation_output.sum()) / num_train
+        C = gram - validation_features.T.dot(validation_features) - num_train * np.outer(feature_mean, feature_mean)
+        c = xty - validation_features.T.dot(validation_output) - num_train * feature_mean * output_mean
+
+        s, V = np.linalg.eigh(C)
+        weights = _ridge_solve_all(s, V, c, l2_penalties)
+        intercepts = output_mean - feature_mean.dot(weights)
+        validation_error = validation_features.dot(weights) + intercepts - validation_output[:, np.newaxis]
+        error += np.sum(validation_error ** 2, axis=0)
+
+    return error / k
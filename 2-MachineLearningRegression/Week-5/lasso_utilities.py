@@ -0,0 +1,137 @@
+import numpy as np
+
+def get_numpy_data(data_sframe, features, output):
+    data_sframe['constant'] = 1 # add a constant column to the SFrame
+    # prepend 'constant' to the features so it is extracted with the others
+    features = ['constant'] + features
+    feature_matrix = data_sframe[features].to_numpy()
+    output_array = data_sframe[output].to_numpy()
+    return(feature_matrix, output_array)
+
+def predict_output(feature_matrix, weights):
+    return np.dot(feature_matrix, weights)
+
+def normalize_features(feature_matrix):
+    norms = np.linalg.norm(feature_matrix, axis=0)
+    normalized_features = feature_matrix / norms
+    return(normalized_features, norms)
+
+def soft_threshold(ro_i, l1_penalty):
+    if ro_i < -l1_penalty/2.:
+        return ro_i + l1_penalty/2.
+    elif ro_i > l1_penalty/2.:
+        return ro_i - l1_penalty/2.
+    return 0.
+
+def lasso_statistics(feature_matrix, output, precompute='auto'):
+    '''
+    Quantities shared by every lasso fit on the same data. Either the Gram matrix
+    X^T X and X^T y, which make a coordinate update O(d), or nothing but the data,
+    in which case the solver keeps a running residual and an update is O(n).
+    precompute: True, False or 'auto' (the Gram matrix when n is at least 4 times d).'''
+    num_rows, num_features = feature_matrix.shape
+    if precompute == 'auto':
+        precompute = num_rows >= 4 * num_features
+    statistics = {'feature_matrix': feature_matrix,
+                  'output': output,
+                  'squared_norms': np.sum(feature_matrix ** 2, axis=0)}
+    if precompute:
+        statistics['gram'] = feature_matrix.T.dot(feature_matrix)
+        statistics['xty'] = feature_matrix.T.dot(output)
+    return statistics
+
+def _lasso_sweep(statistics, weights, residual, l1_penalty, coordinates):
+    # One cyclical pass over the given coordinates; updates weights (and the residual
+    # when there is no Gram matrix) in place and returns the largest change of a weight.
+    squared_norms = statistics['squared_norms']
+    gram = statistics.get('gram')
+    feature_matrix = statistics['feature_matrix']
+    max_weights_change = 0.
+    for i in coordinates:
+        old_weights_i = weights[i]
+        # ro[i] = SUM[ [feature_i]*(output - prediction + weight[i]*[feature_i]) ]
+        if gram is not None:
+            ro_i = statistics['xty'][i] - gram[i].dot(weights) + squared_norms[i] * old_weights_i
+        else:
+            ro_i = feature_matrix[:, i].dot(residual) + squared_norms[i] * old_weights_i
+
+        if i == 0: # intercept -- do not regularize
+            new_weights_i = ro_i
+        else:
+            new_weights_i = soft_threshold(ro_i, l1_penalty)
+        if squared_norms[i] > 0:
+            new_weights_i /= squared_norms[i]
+        else:
+            new_weights_i = 0.
+
+        if new_weights_i != old_weights_i:
+            weights[i] = new_weights_i
+            if gram is None:
+                residual -= (new_weights_i - old_weights_i) * feature_matrix[:, i]
+            max_weights_change = max(max_weights_change, abs(new_weights_i - old_weights_i))
+    return max_weights_change
+
+def lasso_fit(statistics, initial_weights, l1_penalty, tolerance):
+    '''
+    Cyclical coordinate descent for the lasso on the data of lasso_statistics.
+    After every full pass the solver only cycles through the active set (the intercept
+    and the nonzero weights) until it converges there, then checks with another full
+    pass; it stops once a full pass changes no weight by tolerance or more.'''
+    weights = np.array(initial_weights, dtype=float)
+    residual = None
+    if 'gram' not in statistics:
+        residual = statistics['output'] - predict_output(statistics['feature_matrix'], weights)
+
+    all_coordinates = range(len(weights))
+    while _lasso_sweep(statistics, weights, residual, l1_penalty, all_coordinates) >= tolerance:
+        active = [0] + [i for i in np.flatnonzero(weights) if i != 0]
+        while _lasso_sweep(statistics, weights, residual, l1_penalty, active) >= tolerance:
+            pass
+    return weights
+
+def lasso_cyclical_coordinate_descent(feature_matrix, output, initial_weights, l1_penalty, tolerance,
+                                      precompute='auto'):
+    '''
+    Drop-in replacement for the notebook's lasso_cyclical_coordinate_descent. Each
+    coordinate update uses a running residual or the Gram matrix instead of
+    recomputing every prediction.
+
+    Example
+    >>> weights1e7 = lasso_cyclical_coordinate_descent(train_data_normalized, train_data_output,
+    ...                                                np.zeros(14), 1e7, 1.0)
+    '''
+    statistics = lasso_statistics(feature_matrix, output, precompute)
+    return lasso_fit(statistics, initial_weights, l1_penalty, tolerance)
+
+def lasso_path(feature_matrix, output, l1_penalties, tolerance, initial_weights=None, precompute='auto'):
+    '''
+    Lasso weights for every penalty in l1_penalties, as a len(l1_penalties)-by-d array
+    in the order given. The data statistics are computed once, and the penalties are
+    solved from the largest to the smallest, each fit starting from the previous
+    weights.
+
+    Example
+    >>> l1_penalties = np.logspace(1, 7, num=13)
+    >>> weights = lasso_path(train_data_normalized, train_data_output, l1_penalties, 1.0)
+    '''
+    statistics = lasso_statistics(feature_matrix, output, precompute)
+    l1_penalties = np.asarray(l1_penalties, dtype=float)
+    weights = np.zeros(feature_matrix.shape[1]) if initial_weights is None else initial_weights
+
+    path = np.zeros((len(l1_penalties), feature_matrix.shape[1]))
+    for j in np.argsort(-l1_penalties, kind='mergesort'):
+        weights = lasso_fit(statistics, weights, l1_penalties[j], tolerance)
+        path[j] = weights
+    return path
+
+def select_l1_penalty(train_matrix, train_output, validation_matrix, validation_output, l1_penalties, tolerance,
+                      precompute='auto'):
+    '''
+    Fit the whole lasso path on the training data and pick the penalty with the lowest
+    RSS on the validation data. Returns (best_l1_penalty, best_weights, rss), rss
+    holding the validation RSS of every penalty.'''
+    path = lasso_path(train_matrix, train_output, l1_penalties, tolerance, precompute=precompute)
+    residuals = validation_output[:, np.newaxis] - validation_matrix.dot(path.T)
+    rss = np.sum(residuals ** 2, axis=0)
+    best = int(np.argmin(rss))
+    return l1_penalties[best], path[best], rss
@@ -0,0 +1,295 @@
+import heapq
+import numpy as np
+
+def get_numpy_data(data_sframe, features, output):
+    data_sframe['constant'] = 1 # add a constant column to the SFrame
+    # prepend 'constant' to the features so it is extracted with the others
+    features = ['constant'] + features
+    feature_matrix = data_sframe[features].to_numpy()
+    output_array = data_sframe[output].to_numpy()
+    return(feature_matrix, output_array)
+
+def normalize_features(feature_matrix):
+    norms = np.linalg.norm(feature_matrix, axis=0)
+    normalized_features = feature_matrix / norms
+    return(normalized_features, norms)
+
+def squared_distances(train_feature, query_feature, train_sq_norms=None):
+    '''
+    Squared Euclidean distances between every query row and every training row,
+    computed as ||q||^2 + ||t||^2 - 2 q.t with a single matrix product.
+    Returns a num_queries-by-num_train array.'''
+    if train_sq_norms is None:
+        train_sq_norms = np.sum(train_feature ** 2, axis=1)
+    query_sq_norms = np.sum(query_feature ** 2, axis=1)
+    distances = query_sq_norms[:, np.newaxis] + train_sq_norms - 2 * query_feature.dot(train_feature.T)
+    # Rounding can make distances of (near) duplicates slightly negative
+    return np.maximum(distances, 0)
+
+def k_nearest_neighbors(k, train_feature, query_feature, block_size=None, exclude_self=False):
+    '''
+    Indices and Euclidean distances of the k nearest training rows of every query row.
+    Returns (index, distance), two num_queries-by-k arrays sorted by distance.
+
+    Queries are processed in blocks of block_size rows (by default sized so that a
+    block of distances holds about 4M entries), and only the k smallest distances of
+    each block are selected with argpartition instead of sorting all of them.
+    exclude_self: if True, query_feature must be train_feature itself and every row is
+                  left out of its own neighbors (for leave-one-out estimates).
+
+    Example
+    >>> index, distance = k_nearest_neighbors(4, features_train, features_test[2:3])
+    '''
+    num_train = train_feature.shape[0]
+    num_queries = query_feature.shape[0]
+    k = min(k, num_train - 1 if exclude_self else num_train)
+    if block_size is None:
+        block_size = max(1, (1 << 22) // num_train)
+    train_sq_norms = np.sum(train_feature ** 2, axis=1)
+
+    index = np.zeros((num_queries, k), dtype=np.int64)
+    distance = np.zeros((num_queries, k))
+    for start in range(0, num_queries, block_size):
+        end = min(start + block_size, num_queries)
+        block = squared_distances(train_feature, query_feature[start:end], train_sq_norms)
+        if exclude_self:
+            block[np.arange(end - start), np.arange(start, end)] = np.inf
+
+        # Unordered k smallest of each row, then sort just those k entries
+        nearest = np.argpartition(block, k-1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(block, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind='mergesort')
+        index[start:end] = np.take_along_axis(nearest, order, axis=1)
+        distance[start:end] = np.sqrt(np.take_along_axis(nearest_distances, order, axis=1))
+
+    return index, distance
+
+def kernel_weights(distance, kernel='uniform', bandwidth=None):
+    '''
+    Weights of the neighbors in a num_queries-by-k distance table.
+    kernel:    'uniform' (plain average), 'gaussian' or 'epanechnikov'.
+    bandwidth: kernel width. By default, the distance of each query to its farthest
+               neighbor in the table (an adaptive width).
+    A query whose weights are all zero falls back to uniform weights.'''
+    if kernel == 'uniform':
+        return np.ones_like(distance)
+
+    if bandwidth is None:
+        bandwidth = distance[:, -1:]
+    bandwidth = np.where(bandwidth > 0, bandwidth, 1.)
+    u = distance / bandwidth
+    if kernel == 'gaussian':
+        weights = np.exp(-0.5 * u ** 2)
+    elif kernel == 'epanechnikov':
+        weights = np.maximum(1 - u ** 2, 0)
+    else:
+        raise ValueError('Unknown kernel: %s' % kernel)
+
+    total = np.sum(weights, axis=1, keepdims=True)
+    return np.where(total > 0, weights, 1.)
+
+def predict_from_neighbors(output_value, index, distance, kernel='uniform', bandwidth=None):
+    '''Average (or kernel-weighted average) of the outputs of the neighbors in a table.'''
+    weights = kernel_weights(distance, kernel, bandwidth)
+    return np.sum(weights * output_value[index], axis=1) / np.sum(weights, axis=1)
+
+def predict_price(k, train_feature, output_value, query_feature, kernel='uniform', bandwidth=None,
+                  block_size=None):
+    '''
+    k-nearest neighbor regression for every row of query_feature with a single call.
+    With the default uniform kernel this is the notebook's predict_price (the average
+    output of the k nearest training rows), returned as an array.
+
+    Example
+    >>> prediction_test = predict_price(15, features_train, output_train, features_test)
+    '''
+    index, distance = k_nearest_neighbors(k, train_feature, query_feature, block_size)
+    return predict_from_neighbors(output_value, index, distance, kernel, bandwidth)
+
+def rss_by_k(k_values, train_feature, output_value, query_feature, query_output, kernel='uniform',
+             bandwidth=None, block_size=None, exclude_self=False):
+    '''
+    RSS on (query_feature, query_output) of k-nearest neighbor regression for every k in
+    k_values. The neighbors are searched once, for the largest k; each smaller k uses
+    the first columns of the same table.
+    exclude_self: if True, query_feature must be the training set (row i is training
+                  row i) and every row is left out of its own neighbors, which gives
+                  leave-one-out RSS.
+
+    Example
+    >>> rss_data = rss_by_k(range(1, 16), features_train, output_train, features_valid, output_valid)
+    '''
+    k_values = list(k_values)
+    index, distance = k_nearest_neighbors(max(k_values), train_feature, query_feature, block_size, exclude_self)
+
+    rss = []
+    for k in k_values:
+        prediction = predict_from_neighbors(output_value, index[:, :k], distance[:, :k], kernel, bandwidth)
+        rss.append(np.sum((prediction - query_output) ** 2))
+    return np.array(rss)
+
+def select_k_loo(k_values, train_feature, output_value, kernel='uniform', bandwidth=None, block_size=None):
+    '''
+    Choose k by leave-one-out cross validation on the training set, from a single
+    neighbor table. Returns (best_k, rss), rss holding the leave-one-out RSS of every k.
+
+    Example
+    >>> best_k, rss = select_k_loo(range(1, 16), features_train, output_train)
+    '''
+    k_values = list(k_values)
+    rss = rss_by_k(k_values, train_feature, output_value, train_feature, output_value, kernel, bandwidth,
+                   block_size, exclude_self=True)
+    return k_values[int(np.argmin(rss))], rss
+
+def kd_tree_build(train_feature, leaf_size=40):
+    '''
+    Build a KD-tree over the rows of train_feature, stored as flat numpy arrays:
+    * index:         training row ids, permuted so that every node covers a contiguous range
+    * points:        train_feature[index], so that leaves are scanned from contiguous memory
+    * start, end:    node i covers index[start[i]:end[i]]
+    * left, right:   child node ids (-1 for leaves); node 0 is the root
+    * lower, upper:  bounding box of the rows of each node, used to prune the search
+    Nodes are split on the dimension of largest spread, at the median, until they hold
+    at most leaf_size rows.
+
+    Example
+    >>> tree = kd_tree_build(features_train)
+    >>> index, distance = kd_tree_query(tree, features_test, 10)
+    '''
+    num_train = train_feature.shape[0]
+    index = np.arange(num_train)
+    start, end, left, right, lower, upper = [], [], [], [], [], []
+
+    stack = [(0, num_train, -1, None)]
+    while stack:
+        node_start, node_end, parent, side = stack.pop()
+        node = len(start)
+        if parent >= 0:
+            (left if side == 'left' else right)[parent] = node
+        points = train_feature[index[node_start:node_end]]
+        start.append(node_start)
+        end.append(node_end)
+        left.append(-1)
+        right.append(-1)
+        lower.append(points.min(axis=0) if len(points) else np.zeros(train_feature.shape[1]))
+        upper.append(points.max(axis=0) if len(points) else np.zeros(train_feature.shape[1]))
+
+        if node_end - node_start <= leaf_size:
+            continue
+        # Split at the median of the dimension with the largest spread
+        split_dim = np.argmax(upper[node] - lower[node])
+        middle = (node_end - node_start) // 2
+        order = np.argpartition(points[:, split_dim], middle)
+        index[node_start:node_end] = index[node_start:node_end][order]
+        stack.append((node_start + middle, node_end, node, 'right'))
+        stack.append((node_start, node_start + middle, node, 'left'))
+
+    return {'data': train_feature,
+            'index': index,
+            'points': train_feature[index],
+            'start': np.array(start),
+            'end': np.array(end),
+            'left': np.array(left),
+            'right': np.array(right),
+            'lower': np.array(lower),
+            'upper': np.array(upper),
+            'leaf_size': leaf_size,
+            'pending': np.arange(num_train, num_train)}
+
+def kd_tree_insert(tree, new_feature, rebuild_fraction=0.25):
+    '''
+    Add the rows of new_feature to a KD-tree; they get the ids following the existing
+    rows, so the matching outputs should be appended to the output array in the same
+    order. New rows are kept in a small pending block that queries scan directly, and
+    the tree is rebuilt once that block exceeds rebuild_fraction of the indexed rows.
+    Returns the updated tree.
+
+    Example
+    >>> tree = kd_tree_insert(tree, new_sales_features)
+    >>> output_train = np.concatenate((output_train, new_sales_prices))
+    '''
+    num_indexed = len(tree['index'])
+    data = np.vstack((tree['data'], new_feature))
+    pending = np.arange(num_indexed, data.shape[0])
+    if len(pending) > rebuild_fraction * num_indexed:
+        return kd_tree_build(data, tree['leaf_size'])
+
+    tree['data'] = data
+    tree['pending'] = pending
+    return tree
+
+def _box_sq_distance(tree, node, query):
+    # Squared distance from a query to the bounding box of a node
+    gap = np.maximum(tree['lower'][node] - query, 0) + np.maximum(query - tree['upper'][node], 0)
+    return gap.dot(gap)
+
+def _kd_tree_search(tree, query, k=None, radius=None):
+    # Best-first search of a single query. Collects (ids, squared distances) of either the
+    # k nearest rows or every row within radius.
+    pending = tree['pending']
+    diff = tree['data'][pending] - query
+    ids, sq_distances = pending, np.sum(diff ** 2, axis=1)
+    if radius is not None:
+        keep = sq_distances <= radius ** 2
+        ids, sq_distances = ids[keep], sq_distances[keep]
+        bound = radius ** 2
+    else:
+        bound = np.inf
+        if len(ids) >= k:
+            bound = np.partition(sq_distances, k-1)[k-1]
+
+    heap = [(_box_sq_distance(tree, 0, query), 0)]
+    while heap:
+        box_distance, node = heapq.heappop(heap)
+        if box_distance > bound:
+            break
+        if tree['left'][node] >= 0:
+            for child in (tree['left'][node], tree['right'][node]):
+                child_distance = _box_sq_distance(tree, child, query)
+                if child_distance <= bound:
+                    heapq.heappush(heap, (child_distance, child))
+            continue
+
+        # Scan a leaf
+        node_start, node_end = tree['start'][node], tree['end'][node]
+        diff = tree['points'][node_start:node_end] - query
+        leaf_distances = np.sum(diff ** 2, axis=1)
+        if radius is not None:
+            keep = leaf_distances <= bound
+            ids = np.concatenate((ids, tree['index'][node_start:node_end][keep]))
+            sq_distances = np.concatenate((sq_distances, leaf_distances[keep]))
+            continue
+        ids = np.concatenate((ids, tree['index'][node_start:node_end]))
+        sq_distances = np.concatenate((sq_distances, leaf_distances))
+        if len(ids) > k:
+            nearest = np.argpartition(sq_distances, k-1)[:k]
+            ids, sq_distances = ids[nearest], sq_distances[nearest]
+        if len(ids) == k:
+            bound = np.max(sq_distances)
+
+    order = np.lexsort((ids, sq_distances))
+    return ids[order], np.sqrt(sq_distances[order])
+
+def kd_tree_query(tree, query_feature, k):
+    '''
+    Exact k nearest neighbors of every row of query_feature in a KD-tree.
+    Returns (index, distance), two num_queries-by-k arrays sorted by distance, like
+    k_nearest_neighbors. Only the leaves whose bounding box is closer than the current
+    k-th neighbor are scanned, so a query touches a few leaves rather than every row.'''
+    k = min(k, tree['data'].shape[0])
+    index = np.zeros((query_feature.shape[0], k), dtype=np.int64)
+    distance = np.zeros((query_feature.shape[0], k))
+    for i, query in enumerate(query_feature):
+        index[i], distance[i] = _kd_tree_search(tree, query, k=k)
+    return index, distance
+
+def kd_tree_query_radius(tree, query_feature, radius):
+    '''
+    Training rows within radius of every row of query_feature. Returns (index, distance),
+    two lists with one array per query, sorted by distance.'''
+    index, distance = [], []
+    for query in query_feature:
+        ids, query_distance = _kd_tree_search(tree, query, radius=radius)
+        index.append(ids)
+        distance.append(query_distance)
+    return index, distance
@@ -0,0 +1,300 @@
+import multiprocessing
+import numpy as np
+import sys
+
+def to_numpy_data(data, features, target):
+    '''
+    Convert the binary feature columns and the +1/-1 target column of an SFrame (or
+    pandas DataFrame) into a compact uint8 feature matrix and an int8 label array.
+
+    Example
+    >>> X, y = to_numpy_data(train_data, features, 'safe_loans')
+    '''
+    X = np.column_stack([np.asarray(data[feature], dtype=np.uint8) for feature in features])
+    y = np.asarray(data[target], dtype=np.int8)
+    return X, y
+
+def split_mistakes(X, y, rows, data_weights=None):
+    '''
+    Count, for every feature at once, the mistakes the majority classifier makes on
+    each side of a split of the given rows. Returns (left_mistakes, right_mistakes),
+    two arrays with one entry per feature. With data_weights, mistakes are weighted.'''
+    node = X[rows]
+    positive = y[rows] == 1
+    weights = np.ones(len(rows)) if data_weights is None else data_weights[rows]
+
+    # Weight of each class on the right side (feature == 1) of every feature, in one
+    # product per class; the left side is the node total minus the right side.
+    right_positive = (weights * positive).dot(node)
+    right_negative = (weights * ~positive).dot(node)
+    left_positive = np.sum(weights[positive]) - right_positive
+    left_negative = np.sum(weights[~positive]) - right_negative
+
+    return np.minimum(left_positive, left_negative), np.minimum(right_positive, right_negative)
+
+def node_mistakes(labels_in_node, data_weights=None):
+    '''Mistakes (or their weight) of the majority classifier on the given labels.'''
+    positive = labels_in_node == 1
+    if data_weights is None:
+        return min(np.sum(positive), np.sum(~positive))
+    return min(np.sum(data_weights[positive]), np.sum(data_weights[~positive]))
+
+def create_leaf(target_values, data_weights=None):
+    # Create a leaf node
+    leaf = {'splitting_feature': None,
+            'left': None,
+            'right': None,
+            'is_leaf': True}
+
+    # For the leaf node, set the prediction to be the majority class.
+    positive = target_values == 1
+    if data_weights is None:
+        num_ones, num_minus_ones = np.sum(positive), np.sum(~positive)
+        leaf['prediction'] = +1 if num_ones > num_minus_ones else -1
+    else:
+        # The weighted tree of the notebook predicts +1 on a tie
+        num_ones, num_minus_ones = np.sum(data_weights[positive]), np.sum(data_weights[~positive])
+        leaf['prediction'] = +1 if num_ones >= num_minus_ones else -1
+
+    return leaf
+
+def decision_tree_create(X, y, features, current_depth=0, max_depth=10, min_node_size=1,
+                         min_error_reduction=0.0, data_weights=None, verbose=False):
+    '''
+    Build a binary decision tree over a uint8 feature matrix X and +1/-1 labels y (see
+    to_numpy_data). features names the columns of X, and the returned tree has the same
+    nested-dict format as the notebook version, so classify and count_nodes still work.
+
+    Nodes are represented by arrays of row indices into X: the class counts of every
+    candidate split come from one vectorized pass over the node's rows (split_mistakes),
+    and children receive index arrays instead of copies of the data.
+    The stopping conditions are the notebook's: pure node, no remaining features,
+    max_depth, min_node_size and min_error_reduction. With data_weights, mistakes are
+    weighted as in weighted_decision_tree_create.
+    '''
+    rows = np.arange(X.shape[0])
+    remaining = np.ones(X.shape[1], dtype=bool)
+    return _decision_tree_node(X, y, features, rows, remaining, current_depth, max_depth, min_node_size,
+                               min_error_reduction, data_weights, verbose)
+
+def _decision_tree_node(X, y, features, rows, remaining, current_depth, max_depth, min_node_size,
+                        min_error_reduction, data_weights, verbose):
+    target_values = y[rows]
+    weights = None if data_weights is None else data_weights[rows]
+    if verbose:
+        print('--------------------------------------------------------------------')
+        print('Subtree, depth = %s (%s data points).' % (current_depth, len(rows)))
+
+    # Stopping condition 1: All nodes are of the same type.
+    mistakes = node_mistakes(target_values, weights)
+    if mistakes == 0:
+        if verbose:
+            print('Stopping condition 1 reached. All data points have the same target value.')
+        return create_leaf(target_values, weights)
+
+    # Stopping condition 2: No more features to split on.
+    if not np.any(remaining):
+        if verbose:
+            print('Stopping condition 2 reached. No remaining features.')
+        return create_leaf(target_values, weights)
+
+    # Early stopping condition 1: Reached max depth limit.
+    if current_depth >= max_depth:
+        if verbose:
+            print('Early stopping condition 1 reached. Reached maximum depth.')
+        return create_leaf(target_values, weights)
+
+    # Early stopping condition 2: Reached the minimum node size.
+    if len(rows) <= min_node_size:
+        if verbose:
+            print('Early stopping condition 2 reached. Reached minimum node size.')
+        return create_leaf(target_values, weights)
+
+    # Find the best splitting feature: the first remaining feature with the lowest error
+    left_mistakes, right_mistakes = split_mistakes(X, y, rows, data_weights)
+    split_errors = np.where(remaining, left_mistakes + right_mistakes, np.inf)
+    splitting_feature = int(np.argmin(split_errors))
+
+    # Early stopping condition 3: Minimum error reduction
+    total = float(len(rows)) if data_weights is None else np.sum(weights)
+    error_before_split = mistakes / total
+    error_after_split = split_errors[splitting_feature] / total
+    if error_before_split - error_after_split <= min_error_reduction:
+        if verbose:
+            print('Early stopping condition 3 reached. Minimum error reduction.')
+        return create_leaf(target_values, weights)
+
+    right = X[rows, splitting_feature] == 1
+    left_rows, right_rows = rows[~right], rows[right]
+    child_remaining = remaining.copy()
+    child_remaining[splitting_feature] = False
+    if verbose:
+        print('Split on feature %s. (%s, %s)' % (features[splitting_feature], len(left_rows), len(right_rows)))
+        sys.stdout.flush()
+
+    # Repeat (recurse) on left and right subtrees
+    left_tree = _decision_tree_node(X, y, features, left_rows, child_remaining, current_depth + 1, max_depth,
+                                    min_node_size, min_error_reduction, data_weights, verbose)
+    right_tree = _decision_tree_node(X, y, features, right_rows, child_remaining, current_depth + 1, max_depth,
+                                     min_node_size, min_error_reduction, data_weights, verbose)
+
+    return {'is_leaf'          : False,
+            'prediction'       : None,
+            'splitting_feature': features[splitting_feature],
+            'left'             : left_tree,
+            'right'            : right_tree}
+
+def compile_tree(tree, features):
+    '''
+    Flatten a nested-dict tree into arrays indexed by node id (the root is node 0):
+    * feature:    column of X the node splits on, -1 for leaves
+    * left/right: child node ids (taken when the feature is 0/1), -1 for leaves
+    * prediction: +1/-1 for leaves, 0 for internal nodes
+    features gives the column order of X, as passed to decision_tree_create.'''
+    column = dict((feature, i) for i, feature in enumerate(features))
+    feature, left, right, prediction = [], [], [], []
+
+    # Number the nodes in preorder with an explicit stack of (node, parent slot) pairs.
+    stack = [(tree, None)]
+    while stack:
+        node, slot = stack.pop()
+        node_id = len(feature)
+        if slot is not None:
+            slot[0][slot[1]] = node_id
+        left.append(-1)
+        right.append(-1)
+        if node['is_leaf']:
+            feature.append(-1)
+            prediction.append(node['prediction'])
+        else:
+            feature.append(column[node['splitting_feature']])
+            prediction.append(0)
+            stack.append((node['right'], (right, node_id)))
+            stack.append((node['left'], (left, node_id)))
+
+    return {'feature': np.array(feature, dtype=np.int32),
+            'left': np.array(left, dtype=np.int32),
+            'right': np.array(right, dtype=np.int32),
+            'prediction': np.array(prediction, dtype=np.int8),
+            'features': list(features)}
+
+def predict_batch(flat_tree, X):
+    '''
+    Predict the class of every row of X with a compiled tree. All rows move down the
+    tree together, one level per step, so the number of Python steps is the tree depth.'''
+    node = np.zeros(X.shape[0], dtype=np.int32)
+    active = np.arange(X.shape[0])
+    while len(active) > 0:
+        split = flat_tree['feature'][node[active]]
+        internal = split >= 0
+        active, split = active[internal], split[internal]
+        current = node[active]
+        # Feature value 0 goes to the left child, anything else to the right child
+        node[active] = np.where(X[active, split] == 0, flat_tree['left'][current], flat_tree['right'][current])
+
+    return flat_tree['prediction'][node]
+
+def evaluate_classification_error(flat_tree, X, y):
+    '''Fraction of the rows of X that a compiled tree misclassifies.'''
+    return np.sum(predict_batch(flat_tree, X) != y) / float(len(y))
+
+def count_nodes(flat_tree):
+    return len(flat_tree['feature'])
+
+def count_leaves(flat_tree):
+    return int(np.sum(flat_tree['feature'] < 0))
+
+def save_tree(filename, flat_tree):
+    '''Save a compiled tree as a single .npz file of its arrays and feature names.'''
+    np.savez(filename, feature=flat_tree['feature'], left=flat_tree['left'], right=flat_tree['right'],
+             prediction=flat_tree['prediction'], features=np.array(flat_tree['features'], dtype=str))
+
+def load_tree(filename):
+    loader = np.load(filename)
+    return {'feature': loader['feature'],
+            'left': loader['left'],
+            'right': loader['right'],
+            'prediction': loader['prediction'],
+            'features': [str(feature) for feature in loader['features']]}
+
+def decision_tree_ensemble_create(X, y, features, num_trees, max_depth=10, min_node_size=1, min_error_reduction=0.0,
+                                  bootstrap=True, max_features=None, seed=None, n_jobs=1):
+    '''
+    Train a bagged (and optionally random-subspace) ensemble of decision trees and
+    return it as a list of compiled trees (see compile_tree).
+    bootstrap:    if True, every tree is grown on a bootstrap sample of the rows. The sample
+                  is an array of row indices into X, so no data is copied.
+    max_features: (optional) number of features each tree may split on, drawn at random.
+    n_jobs:       number of processes to grow trees in (-1 for all cores). X and y are
+                  handed to each worker once, not pickled per tree.
+    The early stopping parameters are those of decision_tree_create.'''
+    if seed is not None:
+        np.random.seed(seed)
+    tree_seeds = np.random.randint(0, 2**31 - 1, num_trees)
+    tasks = [(tree_seed, features, bootstrap, max_features, max_depth, min_node_size, min_error_reduction)
+             for tree_seed in tree_seeds]
+
+    return _tree_worker_map(_tree_worker_create, tasks, (X, y), n_jobs)
+
+def predict_ensemble(flat_trees, X, n_jobs=1):
+    '''
+    Majority vote of an ensemble of compiled trees for every row of X (+1 when the
+    average prediction is positive, -1 otherwise). With n_jobs > 1 the rows are split
+    into one block per process.'''
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    blocks = [rows for rows in np.array_split(np.arange(X.shape[0]), max(n_jobs, 1)) if len(rows) > 0]
+    tasks = [(flat_trees, rows[0], rows[-1] + 1) for rows in blocks]
+    scores = np.concatenate(_tree_worker_map(_tree_worker_predict, tasks, X, n_jobs))
+
+    return np.where(scores > 0, 1, -1)
+
+# Data handed to each worker process of the ensemble functions. With the fork start
+# method the workers inherit it from the parent without any pickling.
+_tree_worker_data = None
+
+def _tree_worker_init(data):
+    global _tree_worker_data
+    _tree_worker_data = data
+
+def _tree_worker_map(function, tasks, data, n_jobs):
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    if n_jobs <= 1 or len(tasks) <= 1:
+        _tree_worker_init(data)
+        try:
+            return [function(task) for task in tasks]
+        finally:
+            _tree_worker_init(None)
+
+    try:
+        context = multiprocessing.get_context('fork')
+    except (AttributeError, ValueError):
+        context = multiprocessing
+    pool = context.Pool(min(n_jobs, len(tasks)), initializer=_tree_worker_init, initargs=(data,))
+    try:
+        return pool.map(function, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+def _tree_worker_create(args):
+    tree_seed, features, bootstrap, max_features, max_depth, min_node_size, min_error_reduction = args
+    X, y = _tree_worker_data
+    random = np.random.RandomState(tree_seed)
+
+    n = X.shape[0]
+    rows = random.randint(0, n, n) if bootstrap else np.arange(n)
+    remaining = np.ones(X.shape[1], dtype=bool)
+    if max_features is not None:
+        remaining[:] = False
+        remaining[random.choice(X.shape[1], max_features, replace=False)] = True
+
+    tree = _decision_tree_node(X, y, features, rows, remaining, 0, max_depth, min_node_size,
+                               min_error_reduction, None, False)
+    return compile_tree(tree, features)
+
+def _tree_worker_predict(args):
+    flat_trees, start, end = args
+    X = _tree_worker_data[start:end]
+    return np.mean([predict_batch(flat_tree, X) for flat_tree in flat_trees], axis=0)
@@ -0,0 +1,133 @@
+from math import exp
+from math import log
+import numpy as np
+import sys
+
+def to_numpy_data(data, features, target):
+    '''
+    Convert the binary feature columns and the +1/-1 target column of an SFrame (or
+    pandas DataFrame) into a compact uint8 feature matrix and an int8 label array.
+
+    Example
+    >>> X, y = to_numpy_data(train_data, features, 'safe_loans')
+    '''
+    X = np.column_stack([np.asarray(data[feature], dtype=np.uint8) for feature in features])
+    y = np.asarray(data[target], dtype=np.int8)
+    return X, y
+
+def create_leaf(prediction):
+    return {'splitting_feature': None,
+            'left': None,
+            'right': None,
+            'is_leaf': True,
+            'prediction': prediction}
+
+def weighted_stump_create(X, y, features, data_weights):
+    '''
+    Learn a weighted decision stump for all features at once. The weight of each class
+    on the right side (feature == 1) of every feature is one product with X; the left
+    side is the total minus the right side. Each side predicts the class with the larger
+    weight (+1 on ties). Returns a tree in the notebook's nested-dict format.
+
+    This is a corrected weighted-error stump, not a copy of the notebook's
+    weighted_decision_tree_create(..., max_depth=1): the notebook's
+    intermediate_node_weighted_mistakes always returns the weight of the positive
+    examples as the error of a side, even when the side predicts +1, while here the
+    error of a side is the weight of the class it does not predict. The two can choose
+    different splitting features; the leaf predictions agree.'''
+    positive = y == 1
+    total_positive = np.sum(data_weights[positive])
+    total_negative = np.sum(data_weights[~positive])
+
+    # Stopping condition 1. Error is 0.
+    if min(total_positive, total_negative) <= 1e-15:
+        return create_leaf(+1 if total_negative <= total_positive else -1)
+
+    right_positive = (data_weights * positive).dot(X)
+    right_negative = (data_weights * ~positive).dot(X)
+    left_positive = total_positive - right_positive
+    left_negative = total_negative - right_negative
+    errors = np.minimum(left_positive, left_negative) + np.minimum(right_positive, right_negative)
+    f = int(np.argmin(errors))
+
+    # Create a leaf node if the split is "perfect"
+    right_size = np.count_nonzero(X[:, f])
+    if right_size == 0 or right_size == X.shape[0]:
+        return create_leaf(+1 if total_negative <= total_positive else -1)
+
+    return {'is_leaf'          : False,
+            'prediction'       : None,
+            'splitting_feature': features[f],
+            'left'             : create_leaf(+1 if left_negative[f] <= left_positive[f] else -1),
+            'right'            : create_leaf(+1 if right_negative[f] <= right_positive[f] else -1)}
+
+def stump_predict(tree_stump, X, features):
+    '''Predictions of a stump for every row of X.'''
+    if tree_stump['is_leaf']:
+        return np.repeat(tree_stump['prediction'], X.shape[0])
+    column = X[:, features.index(tree_stump['splitting_feature'])]
+    return np.where(column == 0, tree_stump['left']['prediction'], tree_stump['right']['prediction'])
+
+def adaboost_with_tree_stumps(X, y, features, num_tree_stumps, validation_data=None, early_stopping_rounds=None,
+                              record_validation_error=None, verbose=False):
+    '''AdaBoost with weighted decision stumps over a uint8 feature matrix X and +1/-1 labels y.
+       validation_data: (optional) (X_validation, y_validation), scored after every round.
+       early_stopping_rounds: (optional) stop once the validation error has not improved for this
+                              many rounds, and keep only the stumps up to the best round.
+       record_validation_error: (optional) a list, to store the validation error after every round.
+       Returns (stump_weights, tree_stumps) like the notebook version. The data weights and the
+       validation scores are updated incrementally, so no round re-predicts with earlier stumps.'''
+    # start with unweighted data
+    alpha = np.ones(X.shape[0])
+    weights = []
+    tree_stumps = []
+    if validation_data is not None:
+        X_validation, y_validation = validation_data
+        validation_scores = np.zeros(X_validation.shape[0])
+        best_error, best_round = float('inf'), 0
+
+    for t in range(num_tree_stumps):
+        # Learn a weighted decision tree stump
+        tree_stump = weighted_stump_create(X, y, features, alpha)
+        tree_stumps.append(tree_stump)
+
+        # Make predictions and compute the weighted error
+        is_wrong = stump_predict(tree_stump, X, features) != y
+        weighted_error = np.sum(alpha[is_wrong]) / np.sum(alpha)
+        # A perfect stump would get an infinite coefficient
+        weighted_error = max(weighted_error, 1e-15)
+
+        # Compute model coefficient using weighted error
+        weight = 0.5 * log((1 - weighted_error) / weighted_error)
+        weights.append(weight)
+
+        # Adjust weights on data point, then normalize
+        alpha *= np.where(is_wrong, exp(weight), exp(-weight))
+        alpha /= np.sum(alpha)
+
+        if verbose:
+            print('Adaboost Iteration %d: split on %s, weighted error %.5f' %
+                  (t, tree_stump['splitting_feature'], weighted_error))
+            sys.stdout.flush()
+
+        if validation_data is not None:
+            validation_scores += weight * stump_predict(tree_stump, X_validation, features)
+            error = np.mean(np.where(validation_scores > 0, 1, -1) != y_validation)
+            if record_validation_error is not None:
+                record_validation_error.append(error)
+            if error < best_error:
+                best_error, best_round = error, t
+            elif early_stopping_rounds is not None and t - best_round >= early_stopping_rounds:
+                if verbose:
+                    print('Stopping early: best validation error %.5f at iteration %d' % (best_error, best_round))
+                return weights[:best_round+1], tree_stumps[:best_round+1]
+
+    return weights, tree_stumps
+
+def predict_adaboost(stump_weights, tree_stumps, X, features):
+    scores = np.zeros(X.shape[0])
+    for weight, tree_stump in zip(stump_weights, tree_stumps):
+        # Accumulate predictions on scores array
+        scores += weight * stump_predict(tree_stump, X, features)
+
+    return np.where(scores > 0, 1, -1)
@@ -0,0 +1,85 @@
+import numpy as np
+
+def apply_threshold(probabilities, threshold):
+    # +1 if >= threshold and -1 otherwise.
+    return np.where(np.asarray(probabilities) >= threshold, +1, -1)
+
+def precision_recall_curve(targets, probabilities, threshold_values=None):
+    '''
+    Confusion counts, precision, recall and false positive rate of the predictions
+    apply_threshold(probabilities, t) for every threshold t, from a single sort.
+    threshold_values: (optional) thresholds to evaluate, such as np.linspace(0.5, 1, num=100).
+                      By default, every distinct probability, in increasing order.
+    Returns a dict of arrays aligned with 'threshold'. Precision is NaN at thresholds
+    where nothing is predicted positive. With no probabilities and no threshold_values,
+    every array is empty.
+
+    Example
+    >>> curve = precision_recall_curve(test_data['sentiment'], probabilities, np.linspace(0.5, 1, num=100))
+    >>> plot_pr_curve(curve['precision'], curve['recall'], 'Precision recall curve (all)')
+    '''
+    probabilities = np.asarray(probabilities, dtype=float)
+    is_positive = np.asarray(targets) == +1
+    if probabilities.shape != is_positive.shape or probabilities.ndim != 1:
+        raise ValueError('targets and probabilities must be 1-D with the same length, got shapes %s and %s'
+                         % (is_positive.shape, probabilities.shape))
+
+    # Sort once by decreasing probability; cumulative sums give the number of true
+    # positives among the m highest probabilities, for every m
+    order = np.argsort(-probabilities, kind='mergesort')
+    sorted_probabilities = probabilities[order]
+    cumulative_true_positive = np.concatenate(([0], np.cumsum(is_positive[order])))
+
+    if threshold_values is None:
+        # Every distinct probability ends a run of ties in the sorted array; the number
+        # of probabilities >= it is the position where its run ends
+        run_end = np.flatnonzero(np.concatenate((sorted_probabilities[1:] != sorted_probabilities[:-1],
+                                                 [True] if len(sorted_probabilities) else [])))
+        threshold_values = sorted_probabilities[run_end][::-1]
+        predicted_positive = (run_end + 1)[::-1]
+    else:
+        threshold_values = np.asarray(threshold_values, dtype=float)
+        # Number of probabilities >= each threshold
+        predicted_positive = np.searchsorted(-sorted_probabilities, -threshold_values, side='right')
+
+    num_positive = np.sum(is_positive)
+    num_negative = len(probabilities) - num_positive
+    true_positive = cumulative_true_positive[predicted_positive]
+    false_positive = predicted_positive - true_positive
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = true_positive / predicted_positive.astype(float)
+        recall = true_positive / float(num_positive) if num_positive else np.full(len(true_positive), np.nan)
+        false_positive_rate = (false_positive / float(num_negative) if num_negative
+                               else np.full(len(false_positive), np.nan))
+
+    return {'threshold': threshold_values,
+            'true_positive': true_positive,
+            'false_positive': false_positive,
+            'false_negative': num_positive - true_positive,
+            'true_negative': num_negative - false_positive,
+            'precision': precision,
+            'recall': recall,
+            'false_positive_rate': false_positive_rate}
+
+def confusion_counts(targets, probabilities, threshold):
+    '''Confusion counts at a single threshold, as a dict like precision_recall_curve.'''
+    curve = precision_recall_curve(targets, probabilities, [threshold])
+    return dict((key, value[0]) for key, value in curve.items())
+
+def smallest_threshold_for_precision(targets, probabilities, target_precision, threshold_values=None):
+    '''
+    Smallest threshold whose precision is at least target_precision, among
+    threshold_values (every distinct probability by default). Returns (threshold,
+    precision), or (None, None) if no threshold reaches it.
+
+    Example
+    >>> smallest_threshold_for_precision(test_data['sentiment'], probabilities, 0.965,
+    ...                                  np.linspace(0.5, 1, num=100))
+    '''
+    curve = precision_recall_curve(targets, probabilities, threshold_values)
+    with np.errstate(invalid='ignore'):
+        reached = np.flatnonzero(curve['precision'] >= target_precision)
+    if len(reached) == 0:
+        return None, None
+    best = reached[np.argmin(curve['threshold'][reached])]
+    return curve['threshold'][best], curve['precision'][best]
@@ -0,0 +1,141 @@
+from scipy.sparse import csr_matrix
+from scipy.sparse import issparse
+import numpy as np
+import string
+
+def remove_punctuation(text):
+    if isinstance(text, bytes):
+        return text.translate(None, string.punctuation.encode())
+    return text.translate(str.maketrans('', '', string.punctuation))
+
+def get_sparse_data(reviews, labels, vocabulary=None):
+    '''
+    Word count matrix of a column of (punctuation-free) reviews, as a CSR matrix whose
+    first column is the intercept, so it can replace the dense feature_matrix of
+    get_numpy_data. Column j+1 counts vocabulary[j]; the vocabulary is every word of
+    the reviews, sorted, unless one is given (pass the training vocabulary when
+    building the validation matrix). Returns (feature_matrix, label_array, vocabulary).
+
+    Example
+    >>> feature_matrix_train, sentiment_train, vocabulary = get_sparse_data(train_data['review_clean'],
+    ...                                                                     train_data['sentiment'])
+    >>> feature_matrix_valid, sentiment_valid, _ = get_sparse_data(validation_data['review_clean'],
+    ...                                                            validation_data['sentiment'], vocabulary)
+    '''
+    tokens = [review.split() for review in reviews]
+    if vocabulary is None:
+        vocabulary = sorted(set(word for review in tokens for word in review))
+    column = dict((word, j + 1) for j, word in enumerate(vocabulary))
+
+    indices = []
+    indptr = [0]
+    for review in tokens:
+        indices.append(0) # intercept
+        indices.extend(column[word] for word in review if word in column)
+        indptr.append(len(indices))
+    # Repeated words become duplicate entries, which sum_duplicates adds into counts
+    feature_matrix = csr_matrix((np.ones(len(indices)), np.array(indices, dtype=np.int64), np.array(indptr)),
+                                shape=(len(tokens), len(vocabulary) + 1))
+    feature_matrix.sum_duplicates()
+
+    return feature_matrix, np.asarray(labels), vocabulary
+
+def predict_probability(feature_matrix, coefficients):
+    '''P(y_i = +1 | x_i, w) for a dense or sparse feature matrix.'''
+    score = feature_matrix.dot(coefficients)
+    return 1. / (1. + np.exp(-score))
+
+def compute_avg_log_likelihood(feature_matrix, sentiment, coefficients):
+    indicator = (sentiment == +1)
+    scores = feature_matrix.dot(coefficients)
+    # log(1 + exp(-scores)) without overflow
+    logexp = np.logaddexp(0., -scores)
+    return np.sum((indicator - 1) * scores - logexp) / feature_matrix.shape[0]
+
+def learning_rate(step_size, itr, schedule='constant', decay=1.):
+    '''
+    Step size of iteration itr:
+    * 'constant':     step_size
+    * 'inverse':      step_size / (1 + decay * itr)
+    * 'inverse_sqrt': step_size / sqrt(1 + decay * itr)
+    '''
+    if schedule == 'constant':
+        return step_size
+    elif schedule == 'inverse':
+        return step_size / (1. + decay * itr)
+    elif schedule == 'inverse_sqrt':
+        return step_size / np.sqrt(1. + decay * itr)
+    raise ValueError('Unknown learning rate schedule: %s' % schedule)
+
+def logistic_regression_SG(feature_matrix, sentiment, initial_coefficients, step_size, batch_size, max_iter=None,
+                           l2_penalty=0., schedule='constant', decay=1., num_passes=None, seed=1, verbose=False):
+    '''
+    Mini-batch stochastic gradient ascent for logistic regression on a dense or CSR
+    feature matrix. The gradient of a batch is one product X_batch^T errors.
+    With the defaults this follows the notebook's logistic_regression_SG step for step
+    (same shuffles, batches and updates).
+
+    l2_penalty:  maximize the average log likelihood minus l2_penalty / N * ||w||^2
+                 (intercept excluded), which is the objective of logistic_regression_with_L2
+                 divided by the number of data points N.
+    schedule:    step size schedule, see learning_rate.
+    num_passes:  (optional) number of passes over the data, instead of max_iter.
+    The data is reshuffled after each complete pass.
+    Returns (coefficients, log_likelihood_all) like the notebook version.
+
+    Example
+    >>> coefficients, log_likelihood = logistic_regression_SG(feature_matrix_train, sentiment_train,
+    ...                                                       np.zeros(feature_matrix_train.shape[1]),
+    ...                                                       step_size=1e-1, batch_size=100, num_passes=10)
+    '''
+    log_likelihood_all = []
+    num_rows = feature_matrix.shape[0]
+    if issparse(feature_matrix):
+        feature_matrix = csr_matrix(feature_matrix)
+    if num_passes is not None:
+        max_iter = num_passes * int(num_rows / batch_size)
+
+    # make sure it's a float numpy array
+    coefficients = np.array(initial_coefficients, dtype=float)
+    # The intercept is not regularized
+    regularized = np.ones(len(coefficients))
+    regularized[0] = 0.
+    l2_scale = 2. * l2_penalty / num_rows
+
+    np.random.seed(seed = seed)
+    # Shuffle the data before starting
+    permutation = np.random.permutation(num_rows)
+    feature_matrix = feature_matrix[permutation]
+    sentiment = sentiment[permutation]
+
+    i = 0 # index of current batch
+    for itr in range(max_iter):
+        batch = feature_matrix[i:i+batch_size]
+        indicator = (sentiment[i:i+batch_size] == +1)
+        errors = indicator - predict_probability(batch, coefficients)
+
+        # Gradient of every coefficient at once, normalized by the batch size
+        gradient = batch.T.dot(errors) * (1. / batch_size)
+        if l2_penalty:
+            gradient -= l2_scale * regularized * coefficients
+        coefficients += learning_rate(step_size, itr, schedule, decay) * gradient
+
+        # Log likelihood over the *current batch*
+        lp = compute_avg_log_likelihood(batch, sentiment[i:i+batch_size], coefficients)
+        log_likelihood_all.append(lp)
+        if verbose and (itr <= 15 or (itr <= 1000 and itr % 100 == 0) or (itr <= 10000 and itr % 1000 == 0)
+                        or itr % 10000 == 0 or itr == max_iter-1):
+            print('Iteration %*d: Average log likelihood (of data points in batch [%0*d:%0*d]) = %.8f' %
+                  (int(np.ceil(np.log10(max_iter))), itr,
+                   int(np.ceil(np.log10(num_rows))), i,
+                   int(np.ceil(np.log10(num_rows))), i+batch_size, lp))
+
+        # if we made a complete pass over data, shuffle and restart
+        i += batch_size
+        if i+batch_size > num_rows:
+            permutation = np.random.permutation(num_rows)
+            feature_matrix = feature_matrix[permutation]
+            sentiment = sentiment[permutation]
+            i = 0
+
+    return coefficients, log_likelihood_all
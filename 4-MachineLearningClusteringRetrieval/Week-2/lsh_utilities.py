@@ -0,0 +1,292 @@
+from itertools import combinations
+from multiprocessing.pool import ThreadPool
+from scipy.sparse import csr_matrix
+from sklearn.metrics.pairwise import pairwise_distances
+from sklearn.preprocessing import normalize
+import json
+import numpy as np
+import os
+
+def generate_random_vectors(num_vector, dim):
+    return np.random.randn(dim, num_vector)
+
+def encode_bin_bits(bin_index_bits):
+    '''
+    Encode an n-by-num_vector array of bin index bits into integer bin indices,
+    using the first bit as the most significant one.'''
+    num_vector = bin_index_bits.shape[1]
+    powers_of_two = 1 << np.arange(num_vector-1, -1, -1, dtype=np.int64)
+    return np.asarray(bin_index_bits, dtype=np.int64).dot(powers_of_two)
+
+def build_lsh_table(bin_indices):
+    '''
+    Group document ids by bin index. The table is stored CSR-style as three arrays:
+    * keys:    sorted bin indices that contain at least one document
+    * offsets: documents of bin keys[b] are ids[offsets[b]:offsets[b+1]]
+    * ids:     int32 document ids, sorted within each bin
+    '''
+    order = np.argsort(bin_indices, kind='mergesort')
+    keys, counts = np.unique(bin_indices[order], return_counts=True)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    return {'keys': keys, 'offsets': offsets, 'ids': order.astype(np.int32)}
+
+def train_lsh_index(data, num_vector=16, num_tables=4, seed=None):
+    '''
+    Train an LSH index made of num_tables independent hash tables, each using
+    num_vector random hyperplanes. With num_tables=1 the index hashes the documents
+    exactly like train_lsh from the notebook for the same seed.
+
+    Example
+    >>> model = train_lsh_index(corpus, num_vector=16, num_tables=4, seed=143)
+    >>> model['tables'][0]['ids'] # document ids of the first table, grouped by bin
+    '''
+    dim = data.shape[1]
+    if seed is not None:
+        np.random.seed(seed)
+    # One block of num_vector columns per table.
+    random_vectors = np.hstack([generate_random_vectors(num_vector, dim) for t in range(num_tables)])
+
+    # Partition data points into bins for all tables with a single product
+    bin_index_bits = np.asarray(data.dot(random_vectors) >= 0)
+    bin_indices = np.column_stack([encode_bin_bits(bin_index_bits[:, t*num_vector:(t+1)*num_vector])
+                                   for t in range(num_tables)])
+
+    model = {'data': data,
+             'norms': row_norms(data),
+             'bin_indices': bin_indices,
+             'tables': [build_lsh_table(bin_indices[:, t]) for t in range(num_tables)],
+             'random_vectors': random_vectors,
+             'num_vector': num_vector,
+             'num_tables': num_tables}
+
+    return model
+
+def lsh_bins(table, bin_indices):
+    '''
+    Look up an array of bin indices in a table at once. Returns two arrays of equal
+    length, (position, doc_id): the documents stored in every bin that is present,
+    each with the position of its bin in bin_indices. Absent bins contribute nothing.'''
+    bin_indices = np.asarray(bin_indices, dtype=np.int64)
+    keys = table['keys']
+    if len(keys) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    b = np.minimum(np.searchsorted(keys, bin_indices), len(keys) - 1)
+    position = np.flatnonzero(keys[b] == bin_indices)
+    b = b[position]
+
+    # Expand each found bin into its ids[offsets[b]:offsets[b+1]] range
+    starts = table['offsets'][b]
+    lengths = table['offsets'][b+1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(np.sum(lengths))
+    return np.repeat(position, lengths), np.asarray(table['ids'])[offsets].astype(np.int64)
+
+def probe_masks(num_vector, max_search_radius):
+    '''
+    XOR masks that turn a bin index into every bin index within max_search_radius
+    flipped bits of it, ordered by radius (the first mask, 0, is the bin itself).'''
+    powers_of_two = 1 << np.arange(num_vector-1, -1, -1, dtype=np.int64)
+    masks = [np.sum(powers_of_two[list(different_bits)], dtype=np.int64)
+             for search_radius in range(max_search_radius + 1)
+             for different_bits in combinations(range(num_vector), search_radius)]
+    return np.array(masks, dtype=np.int64)
+
+def lsh_candidates(Q, model, max_search_radius):
+    '''
+    Collect the candidate neighbors of every row of the query matrix Q. Returns two
+    arrays of equal length, (query_index, doc_id), sorted by query and without
+    duplicates, covering every document that shares a bin with the query, up to
+    max_search_radius flipped bits, in any table.'''
+    num_vector = model['num_vector']
+    masks = probe_masks(num_vector, max_search_radius)
+
+    # Hash the whole query matrix with a single product
+    bits = np.asarray(Q.dot(model['random_vectors']) >= 0)
+
+    query_index = []
+    doc_ids = []
+    for t, table in enumerate(model['tables']):
+        codes = encode_bin_bits(bits[:, t*num_vector:(t+1)*num_vector])
+        probes = (codes[:, np.newaxis] ^ masks).ravel()
+
+        # Look up all probed bins at once; probe p belongs to query p // len(masks)
+        position, ids = lsh_bins(table, probes)
+        query_index.append(position // len(masks))
+        doc_ids.append(ids)
+
+    # Drop documents found in several bins or tables
+    num_docs = model['data'].shape[0]
+    pairs = np.concatenate(query_index).astype(np.int64) * num_docs + np.concatenate(doc_ids)
+    if pairs.size == 0:
+        # Empty query batch, or every probed bin is empty
+        return pairs, pairs.copy()
+    pairs.sort()
+    pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+
+    return pairs // num_docs, pairs % num_docs
+
+def query_batch(Q, model, k, max_search_radius, block_size=64):
+    '''
+    Approximate k nearest neighbors of every row of the query matrix Q.
+    Returns (ids, distances), two num_queries-by-k arrays sorted by cosine distance.
+    Queries with fewer than k candidates are padded with id -1 and distance inf.
+    Candidates are scored block_size queries at a time, with one sparse product between
+    the distinct candidate documents of the block and the block.
+
+    Example
+    >>> ids, distances = query_batch(corpus[[35817, 24478]], model, k=10, max_search_radius=3)
+    '''
+    data = model['data']
+    Q = csr_matrix(Q)
+    num_queries = Q.shape[0]
+    query_index, doc_ids = lsh_candidates(Q, model, max_search_radius)
+
+    # Dot product of every (query, candidate) pair. Pairs are sorted by query, so the
+    # pairs of each block of queries are a contiguous range.
+    dots = np.zeros(len(query_index))
+    block_starts = np.arange(0, num_queries, block_size)
+    bounds = np.searchsorted(query_index, np.append(block_starts, num_queries))
+    for b, start in enumerate(block_starts):
+        lo, hi = bounds[b], bounds[b+1]
+        if lo == hi:
+            continue
+        # Each candidate row is taken once per block, not once per pair
+        candidates, position = np.unique(doc_ids[lo:hi], return_inverse=True)
+        block = Q[start:start+block_size]
+        # Candidates-by-queries, so that only the small block is converted for the product
+        scores = csr_matrix(data[candidates]).dot(block.T).tocsr()
+        scores.sort_indices()
+        if scores.nnz == 0:
+            continue
+        # Read the pairs from the nonzeros, both keyed by candidate * block rows + query
+        entry_keys = (np.repeat(np.arange(scores.shape[0], dtype=np.int64), np.diff(scores.indptr)) * block.shape[0]
+                      + scores.indices)
+        pair_keys = position.ravel().astype(np.int64) * block.shape[0] + (query_index[lo:hi] - start)
+        found = np.minimum(np.searchsorted(entry_keys, pair_keys), len(entry_keys) - 1)
+        dots[lo:hi] = np.where(entry_keys[found] == pair_keys, scores.data[found], 0)
+
+    norms = row_norms(Q)[query_index] * model['norms'][doc_ids]
+    distances = 1 - dots / np.where(norms > 0, norms, 1)
+
+    # Keep the k closest candidates of each query
+    order = np.lexsort((distances, query_index))
+    query_index = query_index[order]
+    first = np.searchsorted(query_index, np.arange(num_queries))
+    rank = np.arange(len(query_index)) - first[query_index]
+    keep = rank < k
+
+    ids = -np.ones((num_queries, k), dtype=np.int64)
+    dist = np.inf * np.ones((num_queries, k))
+    ids[query_index[keep], rank[keep]] = doc_ids[order][keep]
+    dist[query_index[keep], rank[keep]] = distances[order][keep]
+
+    return ids, dist
+
+def query(vec, model, k, max_search_radius):
+    '''
+    Return the ids and cosine distances of the (approximate) k nearest neighbors of
+    vec, along with the number of candidates examined. Candidates are the documents
+    that share a bin with vec, up to max_search_radius flipped bits, in any table.
+    The result is empty if every probed bin is empty.'''
+    data = model['data']
+    candidates = lsh_candidates(vec, model, max_search_radius)[1]
+    if len(candidates) == 0:
+        return candidates, np.zeros(0), 0
+
+    # Sort candidates by their true distances from the query
+    distances = pairwise_distances(data[candidates], vec, metric='cosine').flatten()
+    order = np.argsort(distances)[:k]
+
+    return candidates[order], distances[order], len(candidates)
+
+def row_norms(data):
+    '''L2 norm of every row of a sparse matrix.'''
+    return np.sqrt(np.asarray(data.multiply(data).sum(axis=1)).ravel())
+
+def brute_force_index(data):
+    '''
+    Prepare a corpus for exact cosine search: rows are L2-normalized once and stored
+    transposed, so a block of queries is scored with one sparse product.'''
+    return {'data': data, 'normalized_t': normalize(csr_matrix(data)).T.tocsr()}
+
+def brute_force_query_batch(Q, index, k, block_size=None, n_jobs=1):
+    '''
+    Exact k nearest neighbors by cosine distance of every row of Q among the documents
+    of a brute_force_index. Returns (ids, distances), two num_queries-by-k arrays
+    sorted by distance.
+
+    Queries are scored in blocks of block_size rows (by default sized so that a block
+    of similarities holds about 4M entries), and only the top k of each block are
+    selected with argpartition. With n_jobs > 1 blocks are processed by a pool of
+    threads; the sparse products release the GIL.
+
+    Example
+    >>> index = brute_force_index(corpus)
+    >>> ids, distances = brute_force_query_batch(corpus[queries], index, k=25)
+    '''
+    data_t = index['normalized_t']
+    num_docs = data_t.shape[1]
+    k = min(k, num_docs)
+    Q = normalize(csr_matrix(Q))
+    if block_size is None:
+        block_size = max(1, (1 << 22) // num_docs)
+
+    def top_k(start):
+        similarity = Q[start:start+block_size].dot(data_t).toarray()
+        # Unordered top k of each row, then sort just those k entries
+        ids = np.argpartition(-similarity, k-1, axis=1)[:, :k]
+        top = np.take_along_axis(similarity, ids, axis=1)
+        order = np.argsort(-top, axis=1, kind='mergesort')
+        return np.take_along_axis(ids, order, axis=1), 1 - np.take_along_axis(top, order, axis=1)
+
+    starts = range(0, Q.shape[0], block_size)
+    if n_jobs != 1:
+        pool = ThreadPool(None if n_jobs < 0 else n_jobs)
+        try:
+            results = pool.map(top_k, starts)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [top_k(start) for start in starts]
+
+    if not results:
+        return np.zeros((0, k), dtype=np.int64), np.zeros((0, k))
+    return np.vstack([ids for ids, dist in results]), np.vstack([dist for ids, dist in results])
+
+def brute_force_query(vec, index, k):
+    '''Exact k nearest neighbors of a single vector; returns (ids, distances).'''
+    ids, distances = brute_force_query_batch(vec, index, k)
+    return ids[0], distances[0]
+
+def save_lsh_index(dirname, model):
+    '''
+    Save the hash tables and random vectors of an index as .npy files under dirname.
+    The data matrix is not saved; pass it to load_lsh_index when querying.'''
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    np.save(os.path.join(dirname, 'random_vectors.npy'), model['random_vectors'])
+    np.save(os.path.join(dirname, 'bin_indices.npy'), model['bin_indices'])
+    for t, table in enumerate(model['tables']):
+        for name in ('keys', 'offsets', 'ids'):
+            np.save(os.path.join(dirname, 'table_{0}_{1}.npy'.format(t, name)), table[name])
+    with open(os.path.join(dirname, 'index.json'), 'w') as f:
+        json.dump({'num_vector': model['num_vector'], 'num_tables': model['num_tables']}, f)
+
+def load_lsh_index(dirname, data=None, mmap_mode='r'):
+    '''
+    Load an index written by save_lsh_index. By default the arrays are memory-mapped,
+    so opening a large index only reads the bins that queries touch.'''
+    with open(os.path.join(dirname, 'index.json')) as f:
+        model = json.load(f)
+    load = lambda name: np.load(os.path.join(dirname, name + '.npy'), mmap_mode=mmap_mode)
+
+    model['data'] = data
+    model['norms'] = row_norms(data) if data is not None else None
+    model['random_vectors'] = load('random_vectors')
+    model['bin_indices'] = load('bin_indices')
+    model['tables'] = [dict((name, load('table_{0}_{1}'.format(t, name))) for name in ('keys', 'offsets', 'ids'))
+                       for t in range(model['num_tables'])]
+
+    return model
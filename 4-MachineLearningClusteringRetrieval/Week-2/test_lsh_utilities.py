@@ -0,0 +1,57 @@
+from scipy.sparse import csr_matrix
+from sklearn.metrics.pairwise import pairwise_distances
+import numpy as np
+
+from lsh_utilities import brute_force_index, brute_force_query_batch, lsh_candidates, query, query_batch, \
+    train_lsh_index
+
+def _model():
+    # Both documents point the same way, so they share one bin in every table
+    data = csr_matrix(np.array([[1., 0., 0.], [2., 0., 0.]]))
+    return data, train_lsh_index(data, num_vector=4, num_tables=2, seed=0)
+
+def test_query_in_empty_bin():
+    data, model = _model()
+    # The opposite vector flips every bit, landing in a bin with no documents
+    vec = -data[0]
+    query_index, doc_ids = lsh_candidates(vec, model, max_search_radius=0)
+    assert len(query_index) == 0 and len(doc_ids) == 0
+
+    ids, distances = query_batch(vec, model, k=2, max_search_radius=0)
+    assert np.array_equal(ids, [[-1, -1]])
+    assert np.all(np.isinf(distances))
+
+    ids, distances, num_candidates = query(vec, model, k=2, max_search_radius=0)
+    assert len(ids) == 0 and len(distances) == 0 and num_candidates == 0
+
+def test_empty_query_batch():
+    data, model = _model()
+    ids, distances = query_batch(data[:0], model, k=2, max_search_radius=1)
+    assert ids.shape == (0, 2) and distances.shape == (0, 2)
+
+def _corpus():
+    rng = np.random.RandomState(0)
+    data = csr_matrix(rng.rand(3000, 800) * (rng.rand(3000, 800) < 0.02))
+    return data, data[rng.choice(3000, 150, replace=False)]
+
+def test_query_batch_matches_brute_force():
+    data, queries = _corpus()
+    # Probing every bin makes every document a candidate, so the search is exact
+    model = train_lsh_index(data, num_vector=6, num_tables=2, seed=1)
+    ids, distances = query_batch(queries, model, k=10, max_search_radius=6, block_size=32)
+    exact_ids, exact_distances = brute_force_query_batch(queries, brute_force_index(data), k=10)
+    assert np.array_equal(ids, exact_ids)
+    assert np.allclose(distances, exact_distances)
+
+def test_query_batch_scores_candidates_exactly():
+    data, queries = _corpus()
+    model = train_lsh_index(data, num_vector=12, num_tables=3, seed=1)
+    ids, distances = query_batch(queries, model, k=10, max_search_radius=2, block_size=32)
+    query_index, doc_ids = lsh_candidates(queries, model, max_search_radius=2)
+    true_distances = pairwise_distances(queries, data, metric='cosine')
+    for i in range(queries.shape[0]):
+        candidates = doc_ids[query_index == i]
+        best = candidates[np.argsort(true_distances[i, candidates], kind='mergesort')[:10]]
+        found = ids[i][ids[i] >= 0]
+        assert np.allclose(np.sort(true_distances[i, found]), np.sort(true_distances[i, best]))
+        assert np.allclose(distances[i][:len(found)], true_distances[i, found])
@@ -0,0 +1,428 @@
+from scipy.sparse import csr_matrix
+from scipy.sparse import issparse
+import multiprocessing
+import numpy as np
+import sys
+import time
+
+def get_initial_centroids(data, k, seed=None):
+    '''Randomly choose k data points as initial centroids'''
+    if seed is not None: # useful for obtaining consistent results
+        np.random.seed(seed)
+    n = data.shape[0] # number of data points
+
+    # Pick K indices from range [0, N).
+    rand_indices = np.random.randint(0, n, k)
+
+    # Keep centroids as dense format, as many entries will be nonzero due to averaging.
+    centroids = data[rand_indices,:].toarray()
+
+    return centroids
+
+def row_squared_norms(data):
+    '''Squared L2 norm of every row of a sparse matrix.'''
+    return np.asarray(data.multiply(data).sum(axis=1)).ravel()
+
+def row_dot_centroid(data, centroids, cluster_assignment):
+    '''
+    Dot product of every row of a sparse matrix with the centroid it is assigned to,
+    computed over the nonzeros only, without forming the assigned centroids densely.'''
+    data = csr_matrix(data)
+    rows = np.repeat(np.arange(data.shape[0]), np.diff(data.indptr))
+    products = data.data * centroids[cluster_assignment[rows], data.indices]
+    return np.bincount(rows, weights=products, minlength=data.shape[0])
+
+def squared_distances_to_centroids(data, centroids, data_sq_norms=None):
+    '''
+    n-by-k squared Euclidean distances computed as ||x||^2 + ||c||^2 - 2 x.c, with a
+    single sparse-dense product. data_sq_norms can be cached across iterations.'''
+    if data_sq_norms is None:
+        data_sq_norms = row_squared_norms(data)
+    distances = np.asarray(data.dot(centroids.T))
+    distances *= -2
+    distances += data_sq_norms[:, np.newaxis]
+    distances += np.sum(centroids**2, axis=1)
+    # Rounding can make the distance of a point to itself slightly negative.
+    return np.maximum(distances, 0, out=distances)
+
+def assign_clusters(data, centroids, data_sq_norms=None):
+    '''Assign every data point to its nearest centroid.'''
+    distances_from_centroids = squared_distances_to_centroids(data, centroids, data_sq_norms)
+    return np.argmin(distances_from_centroids, axis=1)
+
+def revise_centroids(data, k, cluster_assignment, previous_centroids=None):
+    '''
+    Average the data points of each cluster with one product between a k-by-n
+    indicator matrix, scaled by 1/cluster size, and the data.
+    A cluster with no data point keeps its centroid from previous_centroids if given,
+    and is NaN otherwise (the mean of no data points).'''
+    n = data.shape[0]
+    counts = np.bincount(cluster_assignment, minlength=k)
+    scale = 1. / np.maximum(counts, 1)
+    indicator = csr_matrix((scale[cluster_assignment], (cluster_assignment, np.arange(n))), shape=(k, n))
+    new_centroids = indicator.dot(data)
+    if issparse(new_centroids):
+        new_centroids = new_centroids.toarray()
+
+    empty = counts == 0
+    if np.any(empty):
+        new_centroids[empty] = previous_centroids[empty] if previous_centroids is not None else np.nan
+
+    return new_centroids
+
+def compute_heterogeneity(data, k, centroids, cluster_assignment, data_sq_norms=None):
+    '''Sum of squared distances from every data point to its assigned centroid.'''
+    if data_sq_norms is None:
+        data_sq_norms = row_squared_norms(data)
+    counts = np.bincount(cluster_assignment, minlength=k)
+    # sum ||x - c||^2 = sum ||x||^2 - 2 sum x.c + sum ||c||^2
+    return np.sum(data_sq_norms) - 2*np.sum(row_dot_centroid(data, centroids, cluster_assignment)) \
+           + np.sum(counts * np.sum(centroids**2, axis=1))
+
+def kmeans(data, k, initial_centroids, maxiter, record_heterogeneity=None, verbose=False, use_bounds=False):
+    '''This function runs k-means on given data and initial set of centroids.
+       maxiter: maximum number of iterations to run.
+       record_heterogeneity: (optional) a list, to store the history of heterogeneity as function of iterations
+                             if None, do not store the history.
+       verbose: if True, print how many data points changed their cluster labels in each iteration
+       use_bounds: if True, keep Hamerly's upper and lower distance bounds for every point and only
+                   compute distances for points whose nearest centroid may have changed.'''
+    centroids = np.array(initial_centroids, dtype=float)
+    prev_cluster_assignment = None
+    # Squared norms of the data points do not change, so compute them once.
+    data_sq_norms = row_squared_norms(data)
+    total_sq_norm = np.sum(data_sq_norms)
+    bounds = None
+
+    for itr in range(maxiter):
+        if verbose:
+            print(itr)
+
+        # 1. Make cluster assignments using nearest centroids
+        if use_bounds:
+            cluster_assignment, bounds = _assign_clusters_bounded(data, centroids, data_sq_norms, bounds)
+        else:
+            cluster_assignment = assign_clusters(data, centroids, data_sq_norms)
+
+        # 2. Compute a new centroid for each of the k clusters, averaging all data points assigned to that cluster.
+        old_centroids = centroids
+        centroids = revise_centroids(data, k, cluster_assignment, previous_centroids=old_centroids)
+        if use_bounds:
+            bounds = _move_bounds(bounds, np.sqrt(np.sum((centroids-old_centroids)**2, axis=1)))
+
+        # Check for convergence: if none of the assignments changed, stop
+        if prev_cluster_assignment is not None and \
+          (prev_cluster_assignment == cluster_assignment).all():
+            break
+
+        # Print number of new assignments
+        if prev_cluster_assignment is not None:
+            num_changed = np.sum(prev_cluster_assignment!=cluster_assignment)
+            if verbose:
+                print('    {0:5d} elements changed their cluster assignment.'.format(num_changed))
+                sys.stdout.flush()
+
+        # Record heterogeneity convergence metric. Every centroid is the mean of its
+        # members, so sum x.c over a cluster equals n_k ||c||^2 and the heterogeneity
+        # follows from the cached norms without another pass over the data.
+        if record_heterogeneity is not None:
+            counts = np.bincount(cluster_assignment, minlength=k)
+            record_heterogeneity.append(total_sq_norm - np.sum(counts * np.sum(centroids**2, axis=1)))
+
+        prev_cluster_assignment = cluster_assignment[:]
+
+    return centroids, cluster_assignment
+
+def smart_initialize(data, k, seed=None, oversampling_factor=None, rounds=5):
+    '''Use k-means++ to initialize a good set of centroids.
+       The squared distance of every point to its nearest chosen centroid is kept up to
+       date by measuring only the distance to the newest centroid, so seeding costs O(n k).
+       oversampling_factor: (optional) if given, use k-means|| instead: for a few rounds,
+                            sample about oversampling_factor*k points at once with probability
+                            proportional to their squared distance, then reduce the weighted
+                            candidates to k centroids with k-means++. Suited to large n.'''
+    if seed is not None: # useful for obtaining consistent results
+        np.random.seed(seed)
+    if oversampling_factor is not None:
+        return _kmeans_parallel_initialize(data, k, oversampling_factor, rounds)
+
+    n = data.shape[0]
+    data_sq_norms = row_squared_norms(data)
+    centroids = np.zeros((k, data.shape[1]))
+
+    # Randomly choose the first centroid.
+    # Since we have no prior knowledge, choose uniformly at random
+    idx = np.random.randint(n)
+    centroids[0] = data[idx,:].toarray()
+    # Compute distances from the first centroid chosen to all the other data points
+    squared_distances = squared_distances_to_centroids(data, centroids[0:1], data_sq_norms).flatten()
+
+    for i in range(1, k):
+        # Choose the next centroid randomly, so that the probability for each data point to be chosen
+        # is directly proportional to its squared distance from the nearest centroid.
+        idx = np.random.choice(n, 1, p=squared_distances / np.sum(squared_distances))
+        centroids[i] = data[idx,:].toarray()
+        # Only the newest centroid can bring a data point closer
+        np.minimum(squared_distances, squared_distances_to_centroids(data, centroids[i:i+1], data_sq_norms).flatten(),
+                   out=squared_distances)
+
+    return centroids
+
+def _kmeans_parallel_initialize(data, k, oversampling_factor, rounds):
+    n = data.shape[0]
+    data_sq_norms = row_squared_norms(data)
+    candidates = [np.random.randint(n)]
+    squared_distances = squared_distances_to_centroids(data, data[candidates].toarray(), data_sq_norms).flatten()
+
+    for r in range(rounds):
+        total = np.sum(squared_distances)
+        if total == 0:
+            # Every point coincides with a candidate
+            break
+        # Sample every point independently, with probability proportional to its squared distance
+        probability = oversampling_factor * k * squared_distances / total
+        chosen = np.flatnonzero(np.random.random_sample(n) < probability)
+        if len(chosen) == 0:
+            continue
+        candidates.extend(chosen)
+        new_distances = squared_distances_to_centroids(data, data[chosen].toarray(), data_sq_norms)
+        np.minimum(squared_distances, np.min(new_distances, axis=1), out=squared_distances)
+
+    # Weight each candidate by the number of data points closest to it, then run
+    # weighted k-means++ on the (small) candidate set.
+    candidates = data[candidates].toarray()
+    if len(candidates) <= k:
+        return _kmeans_plus_plus_top_up(data, candidates, k, data_sq_norms)
+    weights = np.bincount(assign_clusters(data, candidates, data_sq_norms), minlength=len(candidates))
+
+    candidate_sq_norms = np.sum(candidates**2, axis=1)
+    chosen = [np.random.choice(len(candidates), p=weights / float(np.sum(weights)))]
+    squared_distances = squared_distances_to_centroids(candidates, candidates[chosen], candidate_sq_norms).flatten()
+    for i in range(1, k):
+        p = weights * squared_distances
+        if np.sum(p) == 0:
+            # Fewer than k distinct candidates carry any weight
+            break
+        chosen.append(np.random.choice(len(candidates), p=p / np.sum(p)))
+        np.minimum(squared_distances,
+                   squared_distances_to_centroids(candidates, candidates[chosen[-1:]], candidate_sq_norms).flatten(),
+                   out=squared_distances)
+
+    return _kmeans_plus_plus_top_up(data, candidates[chosen], k, data_sq_norms)
+
+def _kmeans_plus_plus_top_up(data, centroids, k, data_sq_norms):
+    '''
+    Add k-means++ draws from the full data until there are k centroids. When every
+    point already coincides with a centroid (fewer than k distinct points), the rest
+    are drawn uniformly.'''
+    n = data.shape[0]
+    if len(centroids) >= k:
+        return centroids
+    squared_distances = np.min(squared_distances_to_centroids(data, centroids, data_sq_norms), axis=1)
+    centroids = list(centroids)
+    while len(centroids) < k:
+        total = np.sum(squared_distances)
+        idx = np.random.choice(n, p=squared_distances / total) if total > 0 else np.random.randint(n)
+        centroids.append(data[idx].toarray().ravel())
+        np.minimum(squared_distances, squared_distances_to_centroids(data, centroids[-1][np.newaxis],
+                                                                     data_sq_norms).flatten(),
+                   out=squared_distances)
+    return np.array(centroids)
+
+def kmeans_multiple_runs(data, k, maxiter, num_runs, seed_list=None, verbose=False, record_heterogeneity=None, n_jobs=1):
+    '''Run k-means from num_runs k-means++ initializations and return the centroids and cluster
+       assignment of the run with the lowest heterogeneity.
+       record_heterogeneity: (optional) a dict, to store the final heterogeneity of every seed.
+       n_jobs: number of processes to run the seeds in (-1 for all cores). The data is handed
+               to each worker once.'''
+    # Use UTC time if no seeds are provided
+    if seed_list is None:
+        start = int(time.time())
+        seed_list = [start + i for i in range(num_runs)]
+    seed_list = list(seed_list)[:num_runs]
+
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    tasks = [(seed, k, maxiter) for seed in seed_list]
+    if n_jobs > 1:
+        try:
+            context = multiprocessing.get_context('fork')
+        except (AttributeError, ValueError):
+            context = multiprocessing
+        pool = context.Pool(min(n_jobs, len(tasks)), initializer=_kmeans_worker_init, initargs=(data,))
+        try:
+            runs = pool.map(_kmeans_worker_run, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _kmeans_worker_init(data)
+        try:
+            runs = [_kmeans_worker_run(task) for task in tasks]
+        finally:
+            _kmeans_worker_init(None)
+
+    heterogeneity = {}
+    min_heterogeneity_achieved = float('inf')
+    final_centroids = None
+    final_cluster_assignment = None
+    for seed, centroids, cluster_assignment, score in runs:
+        heterogeneity[seed] = score
+        if verbose:
+            print('seed = {0:06d}, heterogeneity = {1:.5f}'.format(seed, score))
+            sys.stdout.flush()
+
+        # if current measurement of heterogeneity is lower than previously seen,
+        # update the minimum record of heterogeneity.
+        if score < min_heterogeneity_achieved:
+            min_heterogeneity_achieved = score
+            final_centroids = centroids
+            final_cluster_assignment = cluster_assignment
+
+    if record_heterogeneity is not None:
+        record_heterogeneity.update(heterogeneity)
+
+    # Return the centroids and cluster assignments that minimize heterogeneity.
+    return final_centroids, final_cluster_assignment
+
+# Data handed to each worker process of kmeans_multiple_runs. With the fork start
+# method the workers inherit it from the parent without any pickling.
+_kmeans_worker_data = None
+
+def _kmeans_worker_init(data):
+    global _kmeans_worker_data
+    _kmeans_worker_data = data
+
+def _kmeans_worker_run(args):
+    seed, k, maxiter = args
+    data = _kmeans_worker_data
+    # Use k-means++ initialization
+    initial_centroids = smart_initialize(data, k, seed)
+    centroids, cluster_assignment = kmeans(data, k, initial_centroids, maxiter)
+    # To save time, compute heterogeneity only once in the end
+    return seed, centroids, cluster_assignment, compute_heterogeneity(data, k, centroids, cluster_assignment)
+
+# Relative margin by which a bound must clear its limit for a point to be skipped, so that
+# rounding in the bounds never skips a point that assign_clusters would move.
+_BOUND_SLACK = 1e-9
+
+def _assign_clusters_bounded(data, centroids, data_sq_norms, bounds):
+    # bounds: (assignment, upper, lower) where upper bounds the distance to the assigned
+    # centroid and lower bounds the distance to every other centroid.
+    if bounds is None:
+        return _closest_two(squared_distances_to_centroids(data, centroids, data_sq_norms))
+
+    cluster_assignment, upper, lower = bounds
+    centroid_sq_norms = np.sum(centroids**2, axis=1)
+    # Half the distance from each centroid to its nearest other centroid
+    between = np.sqrt(squared_distances_to_centroids(csr_matrix(centroids), centroids))
+    np.fill_diagonal(between, np.inf)
+    half_gap = np.min(between, axis=1) / 2
+
+    # A point cannot change cluster while its upper bound stays below both limits.
+    limit = np.maximum(half_gap[cluster_assignment], lower) * (1 - _BOUND_SLACK)
+    check = np.flatnonzero(upper >= limit)
+    if len(check) > 0:
+        # Tighten the upper bound with the exact distance to the assigned centroid
+        subset = data[check]
+        upper[check] = np.sqrt(np.maximum(data_sq_norms[check]
+                                          - 2*row_dot_centroid(subset, centroids, cluster_assignment[check])
+                                          + centroid_sq_norms[cluster_assignment[check]], 0))
+        keep = upper[check] >= limit[check]
+        check = check[keep]
+    if len(check) > 0:
+        squared_distances = squared_distances_to_centroids(data[check], centroids, data_sq_norms[check])
+        cluster_assignment[check], upper[check], lower[check] = _closest_two(squared_distances)[1]
+
+    return cluster_assignment.copy(), (cluster_assignment, upper, lower)
+
+def _closest_two(squared_distances):
+    # The closest centroid is chosen on the squared distances, exactly as assign_clusters
+    # does (taking square roots first can turn near-ties into ties); only the bounds are
+    # distances.
+    rows = np.arange(squared_distances.shape[0])
+    cluster_assignment = np.argmin(squared_distances, axis=1)
+    upper = np.sqrt(squared_distances[rows, cluster_assignment])
+    if squared_distances.shape[1] > 1:
+        # Second smallest distance: the smallest once the closest one is masked out
+        squared_distances[rows, cluster_assignment] = np.inf
+        lower = np.sqrt(np.min(squared_distances, axis=1))
+    else:
+        lower = np.inf * np.ones(len(rows))
+    return cluster_assignment.copy(), (cluster_assignment, upper, lower)
+
+def _move_bounds(bounds, shift):
+    # After the centroids move by shift, the distance to the assigned centroid grows by at
+    # most its shift and the distance to any other centroid shrinks by at most the largest one.
+    assignment, upper, lower = bounds
+    order = np.argsort(shift)[::-1]
+    largest = shift[order[0]]
+    second = shift[order[1]] if len(shift) > 1 else 0.
+    other_shift = np.where(assignment == order[0], second, largest)
+    return assignment, upper + shift[assignment], lower - other_shift
+
+def minibatch_kmeans_state(initial_centroids, counts=None):
+    '''
+    State of a mini-batch k-means run: the centroids and the number of data points
+    each centroid has absorbed so far. To continue from an earlier clustering, pass
+    its centroids and cluster sizes (or scaled-down sizes to let new data count more).'''
+    centroids = np.array(initial_centroids, dtype=float)
+    if counts is None:
+        counts = np.zeros(len(centroids))
+    return {'centroids': centroids, 'counts': np.array(counts, dtype=float)}
+
+def kmeans_partial_fit(state, chunk):
+    '''
+    Update a mini-batch k-means state with a CSR chunk of data points. Every centroid
+    moves toward the mean of the chunk points assigned to it with its own learning rate
+    m/(n+m), where n is the number of points it has absorbed so far and m the number it
+    gets from this chunk; this is the running mean of all points it was given.
+    Returns the cluster assignment of the chunk.'''
+    centroids = state['centroids']
+    k = len(centroids)
+    cluster_assignment = assign_clusters(chunk, centroids)
+
+    chunk_counts = np.bincount(cluster_assignment, minlength=k)
+    indicator = csr_matrix((np.ones(chunk.shape[0]), (cluster_assignment, np.arange(chunk.shape[0]))),
+                           shape=(k, chunk.shape[0]))
+    sums = indicator.dot(chunk)
+    if issparse(sums):
+        sums = sums.toarray()
+
+    updated = chunk_counts > 0
+    total = state['counts'] + chunk_counts
+    learning_rate = chunk_counts[updated] / total[updated]
+    centroids[updated] += learning_rate[:, np.newaxis] * (sums[updated] / chunk_counts[updated, np.newaxis]
+                                                          - centroids[updated])
+    state['counts'] = total
+
+    return cluster_assignment
+
+def minibatch_kmeans(data, k, initial_centroids, batch_size, maxiter, holdout=None, record_heterogeneity=None,
+                     seed=None, verbose=False):
+    '''This function runs mini-batch k-means, drawing maxiter random batches of batch_size rows from data.
+       holdout: (optional) a sample of data points used to monitor convergence without full passes.
+       record_heterogeneity: (optional) a list, to store the heterogeneity of the holdout sample
+                             after every batch. Requires holdout.
+       Returns the final mini-batch state (see minibatch_kmeans_state), which can be fed to
+       kmeans_partial_fit as new data arrives.'''
+    if seed is not None:
+        np.random.seed(seed)
+    n = data.shape[0]
+    state = minibatch_kmeans_state(initial_centroids)
+    if holdout is not None:
+        holdout_sq_norms = row_squared_norms(holdout)
+
+    for itr in range(maxiter):
+        batch = data[np.random.randint(0, n, batch_size)]
+        kmeans_partial_fit(state, batch)
+
+        if holdout is not None and record_heterogeneity is not None:
+            holdout_assignment = assign_clusters(holdout, state['centroids'], holdout_sq_norms)
+            score = compute_heterogeneity(holdout, k, state['centroids'], holdout_assignment, holdout_sq_norms)
+            record_heterogeneity.append(score)
+            if verbose:
+                print('{0:5d}: holdout heterogeneity = {1:.5f}'.format(itr, score))
+                sys.stdout.flush()
+
+    return state
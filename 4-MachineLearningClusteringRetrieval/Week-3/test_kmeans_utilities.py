@@ -0,0 +1,35 @@
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+import numpy as np
+
+from kmeans_utilities import get_initial_centroids, kmeans, smart_initialize
+
+def test_kmeans_parallel_returns_k_centroids():
+    rng = np.random.RandomState(0)
+    datasets = [
+        # Few distinct points, each repeated many times
+        csr_matrix(np.repeat(np.eye(3), 50, axis=0)),
+        # Fewer distinct points than clusters
+        csr_matrix(np.ones((20, 4))),
+        # Very sparse data
+        csr_matrix((rng.rand(200, 300) < 0.005).astype(float)),
+        csr_matrix(rng.rand(100, 5)),
+    ]
+    for data in datasets:
+        for k in (1, 4, 10):
+            for seed in range(5):
+                centroids = smart_initialize(data, k, seed=seed, oversampling_factor=0.1, rounds=2)
+                assert centroids.shape == (k, data.shape[1])
+                assert np.all(np.isfinite(centroids))
+
+def test_bounded_kmeans_matches_plain_kmeans():
+    for seed in range(10):
+        rng = np.random.RandomState(seed)
+        # Unit tf-idf-like rows of a few words each: many near-tied distances
+        dense = (rng.rand(3000, 60) < 0.05) * np.log(1 + rng.randint(1, 3, (3000, 60)))
+        data = normalize(csr_matrix(dense))
+        initial_centroids = get_initial_centroids(data, 10, seed=seed)
+        centroids, cluster_assignment = kmeans(data, 10, initial_centroids, maxiter=30)
+        bounded_centroids, bounded_assignment = kmeans(data, 10, initial_centroids, maxiter=30, use_bounds=True)
+        assert np.array_equal(cluster_assignment, bounded_assignment)
+        assert np.allclose(centroids, bounded_centroids)
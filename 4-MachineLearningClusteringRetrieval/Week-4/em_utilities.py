@@ -1,54 +1,119 @@
 from scipy.sparse import csr_matrix
 from scipy.sparse import spdiags
 from scipy.stats import multivariate_normal
-import graphlab
+import hashlib
+import json
+import multiprocessing
+import os
 import numpy as np
+import shutil
 import sys
+import tempfile
 import time
-from copy import deepcopy
 from sklearn.metrics import pairwise_distances
 from sklearn.preprocessing import normalize
 
-def sframe_to_scipy(x, column_name):
+def sframe_to_scipy(x, column_name, cache_dir=None, cache_key=None):
     '''
     Convert a dictionary column of an SFrame into a sparse matrix format where
     each (row_id, column_id, value) triple corresponds to the value of
     x[row_id][column_id], where column_id is a key in the dictionary.
 
+    x may also be a pandas DataFrame (or any table indexed by column name) whose
+    column holds dicts or lists of (key, value) pairs, as produced for map columns
+    by pyarrow's to_pylist(). Column ids follow the sorted order of the keys, so the
+    same vocabulary always gives the same mapping.
+
+    The mapping has a 'category' column with the key of each column id and an
+    'index' column with the id itself; it is an SFrame when x is an SFrame.
+
+    If cache_dir is given, the matrix and the vocabulary are saved under a
+    sub-directory named after a hash of cache_key, the column name, the number of rows
+    and the contents of a sample of rows (see _column_fingerprint), and later calls
+    that match all of them load them back (memory-mapped) without reading the rest of
+    the column. cache_key should identify the data, e.g. the path the SFrame was
+    loaded from; a different key (or removing the sub-directory) rebuilds it.
+
     Example
     >>> sparse_matrix, map_key_to_index = sframe_to_scipy(sframe, column_name)
+    >>> sparse_matrix, map_key_to_index = sframe_to_scipy(wiki, 'tf_idf', cache_dir='cache',
+    ...                                                   cache_key='people_wiki.gl')
     '''
-    assert x[column_name].dtype() == dict, \
-        'The chosen column must be dict type, representing sparse data.'
-
-    # Create triples of (row_id, feature_id, count).
-    # 1. Add a row number.
-    x = x.add_row_number()
-    # 2. Stack will transform x to have a row for each unique (row, key) pair.
-    x = x.stack(column_name, ['feature', 'value'])
-
-    # Map words into integers using a OneHotEncoder feature transformation.
-    f = graphlab.feature_engineering.OneHotEncoder(features=['feature'])
-    # 1. Fit the transformer using the above data.
-    f.fit(x)
-    # 2. The transform takes 'feature' column and adds a new column 'feature_encoding'.
-    x = f.transform(x)
-    # 3. Get the feature mapping.
-    mapping = f['feature_encoding']
-    # 4. Get the feature id to use for each key.
-    x['feature_id'] = x['encoded_features'].dict_keys().apply(lambda x: x[0])
-
-    # Create numpy arrays that contain the data for the sparse matrix.
-    i = np.array(x['id'])
-    j = np.array(x['feature_id'])
-    v = np.array(x['value'])
-    width = x['id'].max() + 1
-    height = x['feature_id'].max() + 1
+    cache_path = None
+    if cache_dir is not None:
+        if cache_key is None:
+            raise ValueError('cache_key is required with cache_dir')
+        digest = hashlib.sha1(u'{0}\0{1}\0{2}'.format(cache_key, column_name, len(x)).encode('utf-8'))
+        _column_fingerprint(digest, x[column_name])
+        cache_path = os.path.join(cache_dir, '{0}-{1}'.format(column_name, digest.hexdigest()))
+        # The sub-directory only appears once complete (see below)
+        if os.path.isdir(cache_path):
+            with open(os.path.join(cache_path, 'vocabulary.json')) as f:
+                vocabulary = json.load(f)
+            mat = load_sparse_csr(cache_path, mmap_mode='r')
+            return mat, _vocabulary_mapping(x, vocabulary)
+
+    # Create triples of (row_id, feature_id, count) in one pass over the column.
+    keys = []
+    values = []
+    lengths = []
+    for row in x[column_name]:
+        items = row.items() if hasattr(row, 'items') else row
+        row_keys = [k for k, v in items]
+        keys.extend(row_keys)
+        values.extend(v for k, v in items)
+        lengths.append(len(row_keys))
+    v = np.array(values, dtype=float)
+    indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+
+    # Map keys into integers: np.unique gives the sorted vocabulary and, for every
+    # triple, the position of its key in that vocabulary.
+    vocabulary, j = np.unique(np.array(keys, dtype=object), return_inverse=True)
+    vocabulary = list(vocabulary)
 
     # Create a sparse matrix.
-    mat = csr_matrix((v, (i, j)), shape=(width, height))
+    mat = csr_matrix((v, j.ravel(), indptr), shape=(len(lengths), len(vocabulary)))
+    mat.sort_indices()
+
+    if cache_path is not None:
+        # Write into a temporary directory and rename it into place when complete, so
+        # an interrupted write never leaves a partial cache behind.
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_path = tempfile.mkdtemp(dir=cache_dir)
+        try:
+            save_sparse_csr(tmp_path, mat)
+            with open(os.path.join(tmp_path, 'vocabulary.json'), 'w') as f:
+                json.dump(vocabulary, f)
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # Another process finished the same cache first
+            if not os.path.isdir(cache_path):
+                raise
+        finally:
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path)
+
+    return mat, _vocabulary_mapping(x, vocabulary)
+
+def _column_fingerprint(digest, column, num_samples=64):
+    '''
+    Add the contents of up to num_samples evenly spaced rows of a dictionary column
+    (always including the first and the last) to a hashlib digest.'''
+    n = len(column)
+    rows = getattr(column, 'iloc', column)
+    for i in sorted(set(np.linspace(0, n - 1, min(n, num_samples)).astype(int))):
+        row = rows[int(i)]
+        items = row.items() if hasattr(row, 'items') else row
+        entries = sorted((u'{0}'.format(k), repr(float(v))) for k, v in items)
+        digest.update(u'{0}\0{1}\n'.format(i, entries).encode('utf-8'))
 
-    return mat, mapping
+def _vocabulary_mapping(x, vocabulary):
+    mapping = {'category': vocabulary, 'index': list(range(len(vocabulary)))}
+    if hasattr(x, 'add_row_number'):
+        # x is an SFrame: return the mapping in the same type.
+        return type(x)(mapping)
+    return mapping
 
 def diag(array):
     n = len(array)
@@ -77,6 +142,31 @@ def logpdf_diagonal_gaussian(x, mean, cov):
     # sum of pairwise squared Eulidean distances gives SUM[(x_i - mean_i)^2/(2*sigma_i^2)]
     return -np.sum(np.log(np.sqrt(2*np.pi*cov))) - pairwise_distances(scaled_x, [scaled_mean], 'euclidean').flatten()**2
 
+def logpdf_diagonal_gaussian_all(x, x_squared, means, covs):
+    '''
+    Compute logpdf of K multivariate Gaussian distributions with diagonal covariance
+    at every row of x in one pass. Returns an n-by-K numpy array whose k-th column
+    equals logpdf_diagonal_gaussian(x, means[k], covs[k]).
+
+    x should be a sparse matrix and x_squared should be x.multiply(x), which can be
+    computed once and reused across calls.
+    means and covs should be given as K-by-dim 2D numpy arrays.'''
+
+    dim = x.shape[1]
+    assert(means.shape[1] == dim and covs.shape[1] == dim)
+
+    # Per-cluster scaling 1/(2*sigma_i)^2 applied to each variable.
+    scale = 1./(4*covs)
+    # Expand SUM[(x_i - mean_i)^2 * scale_i] into three terms, each of which is a
+    # single product against a K-by-dim matrix instead of one distance pass per cluster.
+    dist = np.asarray(x_squared.dot(scale.T)) \
+           - 2*np.asarray(x.dot((means*scale).T)) \
+           + np.sum(means**2*scale, axis=1)
+    # Rounding may make the expansion slightly negative for points near a mean.
+    np.maximum(dist, 0, out=dist)
+
+    return -np.sum(np.log(np.sqrt(2*np.pi*covs)), axis=1) - dist
+
 def log_sum_exp(x, axis):
     '''Compute the log of a sum of exponentials'''
     x_max = np.max(x, axis=axis)
@@ -85,43 +175,295 @@ def log_sum_exp(x, axis):
     else:
         return x_max + np.log( np.sum(np.exp(x-x_max), axis=0) )
 
-def EM_for_high_dimension(data, means, covs, weights, cov_smoothing=1e-5, maxiter=int(1e3), thresh=1e-4, verbose=False):
+def EM_update_parameters(counts, sums, sq_sums, cov_smoothing):
+    '''
+    M-step for a mixture of diagonal Gaussians given its sufficient statistics:
+    soft counts (length K), weighted sums and weighted sums of squares (K-by-dim).
+    Returns (weights, means, covs) with means and covs as K-by-dim arrays.'''
+    weights = counts / np.sum(counts)
+    mu = sums / counts[:,np.newaxis]
+    Sigma = (sq_sums - 2*mu*sums + (mu**2)*counts[:,np.newaxis]) / counts[:,np.newaxis] \
+            + cov_smoothing*np.ones(sums.shape[1])
+    return weights, mu, Sigma
+
+def EM_for_high_dimension(data, means, covs, weights, cov_smoothing=1e-5, maxiter=int(1e3), thresh=1e-4, verbose=False, n_jobs=1):
     # cov_smoothing: specifies the default variance assigned to absent features in a cluster.
     #                If we were to assign zero variances to absent features, we would be overconfient,
     #                as we hastily conclude that those featurese would NEVER appear in the cluster.
     #                We'd like to leave a little bit of possibility for absent features to show up later.
+    # n_jobs: number of processes used for the E-step and the sufficient-statistic reduction
+    #         (-1 for all cores). The rows are split into one range per process; the data and
+    #         its square are handed to the workers once when the pool starts, and every task
+    #         only names a row range.
     n = data.shape[0]
-    dim = data.shape[1]
-    mu = deepcopy(means)
-    Sigma = deepcopy(covs)
+    mu = np.array(means, dtype=float)
+    Sigma = np.array(covs, dtype=float)
     K = len(mu)
     weights = np.array(weights)
 
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    # data**2 does not change between iterations, so compute it once per fit.
+    data_squared = data.multiply(data).tocsr()
+    pool = None
+    if n_jobs > 1:
+        bounds = np.linspace(0, n, min(n_jobs, n) + 1).astype(int)
+        blocks = list(zip(bounds[:-1], bounds[1:]))
+        pool = _em_worker_pool(len(blocks), (data, data_squared))
+    else:
+        # Transposes are reused by the M-step so that resp.T @ data is a sparse-dense product.
+        data_t = data.T.tocsr()
+        data_squared_t = data_squared.T.tocsr()
+
+    ll = None
+    ll_trace = []
+
+    try:
+        for i in range(maxiter):
+            if pool is not None:
+                # E-step and reduction of the per-block statistics
+                stats = pool.map(_em_worker_statistics, [block + (mu, Sigma, weights) for block in blocks])
+                counts, sums, sq_sums, ll_new = [sum(s) for s in zip(*stats)]
+                last_params = (mu, Sigma, weights)
+                if verbose:
+                    print(ll_new)
+                sys.stdout.flush()
+            else:
+                # E-step: compute responsibilities for all clusters at once
+                logresp = np.log(weights) + logpdf_diagonal_gaussian_all(data, data_squared, mu, Sigma)
+                logresp_norm = log_sum_exp(logresp, axis=1)
+                ll_new = np.sum(logresp_norm)
+                if verbose:
+                    print(ll_new)
+                sys.stdout.flush()
+                logresp -= logresp_norm[:,np.newaxis]
+                resp = np.exp(logresp)
+                counts = np.sum(resp, axis=0)
+
+                # Weighted sums and weighted sums of squares for all clusters (K-by-dim).
+                sums = np.asarray(data_t.dot(resp)).T
+                sq_sums = np.asarray(data_squared_t.dot(resp)).T
+
+            # M-step: update weights, means, covariances
+            weights, mu, Sigma = EM_update_parameters(counts, sums, sq_sums, cov_smoothing)
+
+            # check for convergence in log-likelihood
+            ll_trace.append(ll_new)
+            if ll is not None and (ll_new-ll) < thresh and ll_new > -np.inf:
+                ll = ll_new
+                break
+            else:
+                ll = ll_new
+
+        if pool is not None:
+            # Responsibilities of the last E-step, gathered once instead of on every iteration.
+            resp = np.vstack(pool.map(_em_worker_responsibilities, [block + last_params for block in blocks]))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    out = {'weights':weights,'means':list(mu),'covs':list(Sigma),'loglik':ll_trace,'resp':resp}
+
+    return out
+
+def EM_multiple_runs(data, initializations, n_jobs=1, verbose=False, **kwargs):
+    '''
+    Run EM_for_high_dimension from several initializations, each given as a
+    (means, covs, weights) tuple, and return the output of the run with the highest
+    final log-likelihood. Runs are spread over n_jobs processes (-1 for all cores);
+    the data is handed to each worker once. Other keyword arguments are passed on to
+    EM_for_high_dimension. The final log-likelihood of every run is stored in the
+    returned dict under 'run_loglik'.'''
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = min(n_jobs, len(initializations))
+
+    tasks = [(init, kwargs) for init in initializations]
+    if n_jobs > 1:
+        pool = _em_worker_pool(n_jobs, data)
+        try:
+            outs = pool.map(_em_worker_run, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        outs = [EM_for_high_dimension(data, *init, **kw) for init, kw in tasks]
+
+    run_loglik = [out['loglik'][-1] for out in outs]
+    if verbose:
+        for i, ll in enumerate(run_loglik):
+            print('run={0:03d}, loglik={1:.5f}'.format(i, ll))
+            sys.stdout.flush()
+
+    # A diverged run has a NaN log-likelihood and must never be picked.
+    best = outs[int(np.argmax(np.where(np.isnan(run_loglik), -np.inf, run_loglik)))]
+    best['run_loglik'] = run_loglik
+
+    return best
+
+# Data handed to each worker process by _em_worker_pool. With the fork start method
+# the workers inherit it from the parent without any pickling.
+_em_worker_data = None
+
+def _em_worker_init(data):
+    global _em_worker_data
+    _em_worker_data = data
+
+def _em_worker_pool(n_jobs, data):
+    try:
+        context = multiprocessing.get_context('fork')
+    except (AttributeError, ValueError):
+        context = multiprocessing
+    return context.Pool(n_jobs, initializer=_em_worker_init, initargs=(data,))
+
+def _em_worker_block(start, end):
+    # Rows start:end of the worker's data and of its square, as views
+    data, data_squared = _em_worker_data
+    return csr_rows(data, start, end), csr_rows(data_squared, start, end)
+
+def _em_worker_statistics(args):
+    start, end, mu, Sigma, weights = args
+    chunk, chunk_squared = _em_worker_block(start, end)
+    return EM_sufficient_statistics(chunk, mu, Sigma, weights, chunk_squared=chunk_squared)
+
+def _em_worker_responsibilities(args):
+    start, end, mu, Sigma, weights = args
+    chunk, chunk_squared = _em_worker_block(start, end)
+    return EM_sufficient_statistics(chunk, mu, Sigma, weights, return_resp=True, chunk_squared=chunk_squared)[-1]
+
+def _em_worker_run(args):
+    init, kwargs = args
+    return EM_for_high_dimension(_em_worker_data, *init, **kwargs)
+
+def save_sparse_csr(dirname, mat):
+    '''
+    Save a sparse matrix as a directory of .npy files (data, indices, indptr, shape)
+    that load_sparse_csr can memory-map, so rows are read from disk on demand.'''
+    mat = csr_matrix(mat)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    # Store indices in the dtype csr_matrix keeps them in (int32 unless too large);
+    # any other dtype is converted, and so copied into memory, when loaded.
+    if max(mat.nnz, mat.shape[1]) <= np.iinfo(np.int32).max:
+        index_dtype = np.int32
+    else:
+        index_dtype = np.int64
+    np.save(os.path.join(dirname, 'data.npy'), mat.data)
+    np.save(os.path.join(dirname, 'indices.npy'), mat.indices.astype(index_dtype, copy=False))
+    np.save(os.path.join(dirname, 'indptr.npy'), mat.indptr.astype(index_dtype, copy=False))
+    np.save(os.path.join(dirname, 'shape.npy'), np.array(mat.shape))
+
+def load_sparse_csr(filename, mmap_mode=None):
+    '''
+    Load a sparse matrix saved either as an .npz file with data/indices/indptr/shape
+    entries, or as a directory written by save_sparse_csr. Only the directory format
+    can be memory-mapped (e.g. mmap_mode='r').'''
+    if os.path.isdir(filename):
+        load = lambda name: np.load(os.path.join(filename, name + '.npy'), mmap_mode=mmap_mode)
+    else:
+        loader = np.load(filename)
+        load = lambda name: loader[name]
+    shape = tuple(load('shape'))
+
+    return csr_matrix( (load('data'), load('indices'), load('indptr')), shape=shape, copy=False )
+
+def csr_rows(data, start, end):
+    '''
+    Rows start:end of a CSR matrix, built directly from slices of data/indices/indptr:
+    only the row pointers are copied, and a memory-mapped matrix is not read.'''
+    lo = data.indptr[start]
+    hi = data.indptr[end]
+    return csr_matrix( (np.asarray(data.data[lo:hi]), np.asarray(data.indices[lo:hi]),
+                        np.asarray(data.indptr[start:end+1]) - lo), shape=(end-start, data.shape[1]), copy=False )
+
+def iter_csr_chunks(data, chunk_size=10000):
+    '''
+    Iterate over a CSR matrix in blocks of chunk_size rows. Each block is built
+    directly from slices of data/indices/indptr, so a memory-mapped matrix is only
+    read one block at a time.'''
+    n = data.shape[0]
+    for start in range(0, n, chunk_size):
+        yield csr_rows(data, start, min(start + chunk_size, n))
+
+def EM_sufficient_statistics(chunk, means, covs, weights, return_resp=False, chunk_squared=None):
+    '''
+    E-step on a block of rows. Returns the soft counts, weighted sums and weighted
+    sums of squares of the block for every cluster, along with the block's
+    log-likelihood. Memory is bounded by the block size times K.
+    If return_resp is True, the block's responsibilities are appended to the result.
+    chunk_squared: (optional) chunk.multiply(chunk), when it is computed once ahead.'''
+    if chunk_squared is None:
+        chunk_squared = chunk.multiply(chunk).tocsr()
+    logresp = np.log(weights) + logpdf_diagonal_gaussian_all(chunk, chunk_squared, means, covs)
+    logresp_norm = log_sum_exp(logresp, axis=1)
+    resp = np.exp(logresp - logresp_norm[:,np.newaxis])
+
+    counts = np.sum(resp, axis=0)
+    sums = np.asarray(chunk.T.dot(resp)).T
+    sq_sums = np.asarray(chunk_squared.T.dot(resp)).T
+
+    if return_resp:
+        return counts, sums, sq_sums, np.sum(logresp_norm), resp
+    return counts, sums, sq_sums, np.sum(logresp_norm)
+
+def EM_for_high_dimension_streaming(chunks, means, covs, weights, cov_smoothing=1e-5, maxiter=int(1e3), thresh=1e-4,
+                                    online=False, learning_decay=0.7, learning_offset=1., verbose=False):
+    '''
+    EM for a diagonal-Gaussian mixture over data that arrives as CSR row blocks, for
+    corpora that do not fit in memory.
+
+    chunks: either a re-iterable collection of CSR blocks (e.g. a list) or a function
+            that returns a fresh iterator of blocks for every pass over the data, such as
+            lambda: iter_csr_chunks(load_sparse_csr('tf_idf', mmap_mode='r'), 10000)
+    online: if False, every iteration is one pass that accumulates sufficient statistics
+            over all blocks before the M-step, giving the same result as
+            EM_for_high_dimension. If True, parameters are updated after every block
+            (stochastic EM) using the step size (learning_offset + t)**(-learning_decay),
+            where t counts the blocks seen so far.
+
+    The output has the same keys as EM_for_high_dimension except 'resp', which would
+    require memory proportional to the number of rows. loglik holds one entry per pass.'''
+    mu = np.array(means, dtype=float)
+    Sigma = np.array(covs, dtype=float)
+    weights = np.array(weights, dtype=float)
+    get_chunks = chunks if callable(chunks) else (lambda: chunks)
+
+    # Running per-row averages of the sufficient statistics used by online EM.
+    stats = None
+    t = 0
+
     ll = None
     ll_trace = []
 
     for i in range(maxiter):
-        # E-step: compute responsibilities
-        logresp = np.zeros((n,K))
-        for k in xrange(K):
-            logresp[:,k] = np.log(weights[k]) + logpdf_diagonal_gaussian(data, mu[k], Sigma[k])
-        ll_new = np.sum(log_sum_exp(logresp, axis=1))
+        ll_new = 0.
+        total = None
+        for chunk in get_chunks():
+            counts, sums, sq_sums, chunk_ll = EM_sufficient_statistics(chunk, mu, Sigma, weights)
+            ll_new += chunk_ll
+            if online:
+                rho = (learning_offset + t)**(-learning_decay)
+                chunk_stats = [counts/chunk.shape[0], sums/chunk.shape[0], sq_sums/chunk.shape[0]]
+                if stats is None:
+                    stats = chunk_stats
+                else:
+                    stats = [(1-rho)*s + rho*c for s, c in zip(stats, chunk_stats)]
+                t += 1
+                weights, mu, Sigma = EM_update_parameters(stats[0], stats[1], stats[2], cov_smoothing)
+            elif total is None:
+                total = [counts, sums, sq_sums]
+            else:
+                total[0] += counts
+                total[1] += sums
+                total[2] += sq_sums
+
         if verbose:
             print(ll_new)
         sys.stdout.flush()
-        logresp -= np.vstack(log_sum_exp(logresp, axis=1))
-        resp = np.exp(logresp)
-        counts = np.sum(resp, axis=0)
-
-        # M-step: update weights, means, covariances
-        weights = counts / np.sum(counts)
-        for k in range(K):
-            mu[k] = (diag(resp[:,k]).dot(data)).sum(axis=0)/counts[k]
-            mu[k] = mu[k].A1
 
-            Sigma[k] = diag(resp[:,k]).dot( data.multiply(data)-2*data.dot(diag(mu[k])) ).sum(axis=0) \
-                       + (mu[k]**2)*counts[k]
-            Sigma[k] = Sigma[k].A1 / counts[k] + cov_smoothing*np.ones(dim)
+        if not online:
+            weights, mu, Sigma = EM_update_parameters(total[0], total[1], total[2], cov_smoothing)
 
         # check for convergence in log-likelihood
         ll_trace.append(ll_new)
@@ -131,6 +473,6 @@ def EM_for_high_dimension(data, means, covs, weights, cov_smoothing=1e-5, maxite
         else:
             ll = ll_new
 
-    out = {'weights':weights,'means':mu,'covs':Sigma,'loglik':ll_trace,'resp':resp}
+    out = {'weights':weights,'means':list(mu),'covs':list(Sigma),'loglik':ll_trace}
 
     return out
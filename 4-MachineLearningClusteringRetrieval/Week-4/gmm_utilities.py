@@ -0,0 +1,110 @@
+from scipy.linalg import cholesky
+from scipy.linalg import solve_triangular
+import numpy as np
+
+def log_sum_exp(Z, axis=None):
+    ''' Compute log(sum_i exp(Z_i)) for some array Z, along an axis.'''
+    Z_max = np.max(Z, axis=axis, keepdims=True)
+    result = Z_max + np.log(np.sum(np.exp(Z - Z_max), axis=axis, keepdims=True))
+    return np.squeeze(result, axis=axis) if axis is not None else result.item()
+
+def log_gaussian_all(data, means, covs):
+    '''
+    Log density of every data point under every Gaussian, as an n-by-K array.
+    Each covariance is factored once as L L^T, so that
+        (x-mu)^T Sigma^{-1} (x-mu) = |L^{-1} (x-mu)|^2  and  log det Sigma = 2 sum(log diag L),
+    and the Mahalanobis terms of all points come from one triangular solve per cluster.'''
+    data = np.asarray(data, dtype=float)
+    num_data, num_dim = data.shape
+    result = np.zeros((num_data, len(means)))
+    for k in range(len(means)):
+        L = cholesky(np.asarray(covs[k], dtype=float), lower=True)
+        z = solve_triangular(L, (data - means[k]).T, lower=True)
+        log_det = 2. * np.sum(np.log(np.diag(L)))
+        result[:, k] = -0.5 * (num_dim * np.log(2*np.pi) + log_det + np.sum(z ** 2, axis=0))
+    return result
+
+def _log_joint(data, weights, means, covs):
+    # log(weight_k) + log N(x_i | mean_k, cov_k) for every point and cluster
+    return np.log(weights) + log_gaussian_all(data, means, covs)
+
+def loglikelihood(data, weights, means, covs):
+    ''' Compute the loglikelihood of the data for a Gaussian mixture model with the given parameters. '''
+    return np.sum(log_sum_exp(_log_joint(data, weights, means, covs), axis=1))
+
+def _responsibilities_from_log_joint(log_joint):
+    # Normalize each row in log space; also return the log-likelihood of the data
+    row_ll = log_sum_exp(log_joint, axis=1)
+    return np.exp(log_joint - row_ll[:, np.newaxis]), np.sum(row_ll)
+
+def compute_responsibilities(data, weights, means, covariances):
+    '''E-step: compute responsibilities, given the current parameters'''
+    return _responsibilities_from_log_joint(_log_joint(data, weights, means, covariances))[0]
+
+def compute_soft_counts(resp):
+    # The total responsibility assigned to each cluster, N^{soft} in the lectures
+    return np.sum(resp, axis=0)
+
+def compute_weights(counts):
+    return list(counts / np.sum(counts))
+
+def compute_means(data, resp, counts):
+    data = np.asarray(data, dtype=float)
+    # All weighted sums with a single product
+    return list(resp.T.dot(data) / counts[:, np.newaxis])
+
+def compute_covariances(data, resp, counts, means):
+    '''M-step for the covariances: Sigma_k = (X - mu_k)^T diag(r_k) (X - mu_k) / N_k.'''
+    data = np.asarray(data, dtype=float)
+    covariances = []
+    for k in range(len(counts)):
+        centered = data - means[k]
+        covariances.append((centered * resp[:, k:k+1]).T.dot(centered) / counts[k])
+    return covariances
+
+def EM(data, init_means, init_covariances, init_weights, maxiter=1000, thresh=1e-4, verbose=False):
+    '''
+    EM for a Gaussian mixture with full covariances. Same arguments and output as the
+    notebook's EM ({'weights', 'means', 'covs', 'loglik', 'resp'}), with every step
+    vectorized over the data. The log-likelihood computed after an M-step is reused by
+    the next E-step, so each iteration evaluates the Gaussians once.
+
+    Example
+    >>> results = EM(data, initial_means, initial_covs, initial_weights)
+    '''
+    data = np.asarray(data, dtype=float)
+    # Make copies of initial parameters, which we will update during each iteration
+    means = [np.asarray(mean, dtype=float) for mean in init_means]
+    covariances = [np.asarray(cov, dtype=float) for cov in init_covariances]
+    weights = list(init_weights)
+
+    resp_latest, ll = _responsibilities_from_log_joint(_log_joint(data, weights, means, covariances))
+    ll_trace = [ll]
+
+    for it in range(maxiter):
+        if verbose and it % 5 == 0:
+            print('Iteration %s' % it)
+
+        # E-step: responsibilities of the current parameters
+        resp = resp_latest
+        # M-step
+        counts = compute_soft_counts(resp)
+        weights = compute_weights(counts)
+        means = compute_means(data, resp, counts)
+        covariances = compute_covariances(data, resp, counts, means)
+
+        # Compute the loglikelihood at this iteration, and the next responsibilities with it
+        resp_latest, ll_latest = _responsibilities_from_log_joint(_log_joint(data, weights, means, covariances))
+        ll_trace.append(ll_latest)
+
+        # Check for convergence in log-likelihood
+        if (ll_latest - ll) < thresh and ll_latest > -np.inf:
+            break
+        ll = ll_latest
+
+    if verbose and it % 5 != 0:
+        print('Iteration %s' % it)
+
+    out = {'weights': weights, 'means': means, 'covs': covariances, 'loglik': ll_trace, 'resp': resp}
+
+    return out